@@ -0,0 +1,106 @@
+import argparse
+import json
+import time
+import tracemalloc
+import prod_plot
+from itk_session import ITkSession
+from testrun_cache import TestRunCache
+from mock_itkdb import MockDatabase
+from profiling import timers, max_rss_mb
+
+# benchmark of the download and extraction of prod_plot.py against the stand-in database of mock_itkdb.py, so changes to the fetching, caching and concurrency can be measured offline and reproducibly. the same dataset is served for the same options and seed
+
+# reports the end-to-end time and throughput (Powerboards per second), the time spent in each phase (see profiling.py), the number of requests made to each endpoint and how many of them failed, the bytes received, and the peak memory: the maximum resident set size of the process, and with --trace-memory the peak of memory allocated by Python during the crawl (tracing slows the crawl down, so the time is then less representative). with --full-runs, the full JSON of the test runs is kept until they are extracted, as before the test runs were projected to compact records (see slim_runs.py), to compare the peak memory of both
+
+# example: python benchmark.py --boards 2000 --latency 0.05 --workers 8 --all-variables
+#          python benchmark.py --boards 2000 --all-variables --batch-size 2000 --trace-memory [--full-runs]
+
+def run_benchmark(database, stage, selections, page_size = 100, chunk_size = 100, workers = 1, max_rps = 0.0, retry_delay = 0.05, cache_dir = None, batch_size = 200, trace_memory = False, slim = True):
+    session = ITkSession("", "", max_rps = max_rps, retry_delay = retry_delay, user_factory = database.user, client_factory = database.client)
+    cache = TestRunCache(cache_dir) if cache_dir is not None else None
+    extraction = prod_plot.Extraction(selections, progress = False, keep_values = False)
+    failures = {}
+
+    timers.reset()
+    if trace_memory:
+        tracemalloc.start()
+    start = time.perf_counter()
+    request_stats = prod_plot.crawl(session, prod_plot.iter_components(session, page_size = page_size), stage, extraction, chunk_size = chunk_size, workers = workers, cache = cache, batch_size = batch_size, failures = failures, slim = slim)
+    seconds = time.perf_counter() - start
+    traced_peak = None
+    if trace_memory:
+        traced_peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    session.close()
+
+    metrics = session.metrics.summary()
+    result = {
+        "boards": extraction.count1,
+        "failed_boards": len(failures),
+        "values": sum(extraction.count2),
+        "seconds": round(seconds, 3),
+        "boards_per_second": round(extraction.count1 / seconds, 2) if seconds > 0 else None,
+        "phases": timers.summary(),
+        "requests": dict(database.requests),
+        "failed_requests": dict(database.failures),
+        "test_run_requests": request_stats["requests"],
+        "bytes": sum(endpoint["bytes"] for endpoint in metrics.values()),
+        "max_rss_mb": max_rss_mb(),
+        "traced_peak_mb": round(traced_peak / 2 ** 20, 1) if traced_peak is not None else None
+    }
+    if cache is not None:
+        result["cache"] = cache.stats()
+        cache.close()
+    return result
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = "Benchmark the download and extraction of prod_plot.py against a local stand-in ITk database.")
+    parser.add_argument("--boards", type = int, default = 500, help = "number of components in the stand-in database, every tenth is not a production Powerboard (default: 500)")
+    parser.add_argument("--test-runs", type = int, default = 1, help = "repetitions of every test after each Temperatures test (default: 1)")
+    parser.add_argument("--temperature-runs", type = int, default = 2, help = "Temperatures tests per Powerboard and stage, alternately warm and cold (default: 2)")
+    parser.add_argument("--latency", type = float, default = 0.0, help = "seconds every request takes (default: 0)")
+    parser.add_argument("--latency-per-run", type = float, default = 0.0, help = "additional seconds per test run returned by getTestRunBulk (default: 0)")
+    parser.add_argument("--failure-rate", type = float, default = 0.0, help = "probability of a request failing with a connection error (default: 0)")
+    parser.add_argument("--seed", type = int, default = 1, help = "seed of the random failures and values (default: 1)")
+    parser.add_argument("--stage", default = "BURN_IN", help = "testing stage (default: BURN_IN)")
+    parser.add_argument("--variable", default = "CALx_value", help = "test variable to extract (default: CALx_value, ON state at Warm)")
+    parser.add_argument("--all-variables", action = "store_true", help = "extract every variable in params")
+    parser.add_argument("--page-size", type = int, default = 100)
+    parser.add_argument("--chunk-size", type = int, default = 100)
+    parser.add_argument("--workers", type = int, default = 1)
+    parser.add_argument("--max-rps", type = float, default = 0.0, help = "request rate limit, 0 for no limit (default: 0)")
+    parser.add_argument("--batch-size", type = int, default = 200, help = "Powerboards per crawl batch (default: 200)")
+    parser.add_argument("--cache-dir", default = None, help = "test run cache directory, run twice to measure a warm cache")
+    parser.add_argument("--full-runs", action = "store_true", help = "keep the full JSON of the test runs until they are extracted instead of compact records")
+    parser.add_argument("--trace-memory", action = "store_true", help = "also measure the peak memory allocated by Python with tracemalloc")
+    parser.add_argument("--json", default = None, help = "file the results are written to as JSON")
+    args = parser.parse_args(argv)
+
+    stage = prod_plot.stages.get(args.stage, args.stage)
+    if args.all_variables:
+        selections = prod_plot.all_selections(stage)
+    else:
+        val_name = prod_plot.resolve_variable(args.variable)
+        if val_name is None:
+            parser.error(f"unknown test variable '{args.variable}'")
+        state = "ON" if prod_plot.params[val_name]["offon"] == True else None
+        temp = None if stage == "THERMAL" else "Warm"
+        selections = [(val_name, state, temp, prod_plot.params[val_name]["test_type"])]
+
+    database = MockDatabase(boards = args.boards, test_runs = args.test_runs, temperature_runs = args.temperature_runs, latency = args.latency, latency_per_run = args.latency_per_run, failure_rate = args.failure_rate, seed = args.seed)
+    result = run_benchmark(database, stage, selections, page_size = args.page_size, chunk_size = args.chunk_size, workers = args.workers, max_rps = args.max_rps, cache_dir = args.cache_dir, batch_size = args.batch_size, trace_memory = args.trace_memory, slim = not args.full_runs)
+    result["options"] = vars(args)
+
+    print(f"\n{result['boards']} Powerboards ({result['failed_boards']} failed), {result['values']} values in {result['seconds']} s: {result['boards_per_second']} Powerboards/s")
+    print("requests:", result["requests"], "failed:", result["failed_requests"])
+    print(f"received {result['bytes'] / 1e6:.2f} MB" + (f", max RSS {result['max_rss_mb']} MB" if result["max_rss_mb"] is not None else "") + (f", traced peak {result['traced_peak_mb']} MB" if result["traced_peak_mb"] is not None else ""))
+    if "cache" in result:
+        print("test run cache:", result["cache"])
+    print("\ntime per phase:")
+    timers.report()
+    if args.json is not None:
+        with open(args.json, "w") as f:
+            json.dump(result, f, indent = 1)
+
+if __name__ == "__main__":
+    main()
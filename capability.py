@@ -0,0 +1,169 @@
+import argparse
+import os
+import concurrent.futures
+import numpy as np
+import prod_plot
+from value_store import load_table, save_table, select, group_rows
+
+# production planning statistics of every QC variable, computed from a value table saved with "--values-dir" (see value_store.py): the median, the standard deviation (sigma, as "np.std" in the histograms) and the fraction of Powerboards failing the thresholds, each with a bootstrap confidence interval, and the process capability index Cpk against the thresholds in "params". for every stage, the fraction of Powerboards failing any variable gives the projected yield, and with a number of Powerboards not yet tested, the number of them expected to fail
+
+# the confidence intervals are percentile intervals of the bootstrap: the values of a variable are resampled with replacement many times, and every statistic is computed again for each resample. the resamples are drawn as (resamples, Powerboards) index matrices and computed on whole arrays, in batches of at most batch_elements values so the memory does not grow with the number of resamples. the values are sorted once, so sorting the indices of every resample (much faster than partitioning its values) gives its values in order, and its median directly. the mean and sigma are computed from the sums of the values and their squares, relative to the mean of all values to keep their precision. every variable is an independent task for a pool of processes, with its own random seed derived from "seed", so the results do not depend on the number of processes
+
+# Cpk is the distance of the mean from the nearest threshold in units of three standard deviations: min(high - mean, mean - low) / (3 sigma) for a [low, high] range, and the distance to the one threshold for "less" and "more" thresholds. it is not defined (NaN) for variables that must equal a value, have no threshold, or are checked by comparing their OFF and ON values ("state_threshold")
+
+# values per resampling batch
+
+batch_elements = 2 ** 22
+
+def cpk(mean, sigma, threshold, threshold_dir):
+    mean = np.asarray(mean, dtype = np.float64)
+    with np.errstate(divide = "ignore", invalid = "ignore"):
+        if isinstance(threshold, list):
+            return np.minimum(threshold[1] - mean, mean - threshold[0]) / (3 * sigma)
+        elif threshold is not None and threshold_dir == "less":
+            return (threshold - mean) / (3 * sigma)
+        elif threshold is not None and threshold_dir == "more":
+            return (mean - threshold) / (3 * sigma)
+    return np.full(mean.shape, np.nan)
+
+# percentile interval of the bootstrap estimates of a statistic, NaN if there are none. the ends are estimates themselves rather than interpolated between two, so an infinite Cpk (a resample without spread) gives an infinite end instead of NaN
+
+def interval(estimates, confidence):
+    if len(estimates) == 0:
+        return np.nan, np.nan
+    low, high = np.quantile(estimates, [(1 - confidence) / 2, (1 + confidence) / 2], method = "inverted_cdf")
+    return float(low), float(high)
+
+# bootstrap of one variable, given as a tuple so it can be sent to a process: its values (None for the fraction of Powerboards failing any variable, where only the failure fraction is computed), a boolean array, True for every failing Powerboard, the threshold and threshold_dir used for Cpk, the number of resamples, the confidence level and a "np.random.SeedSequence"
+
+# returns a dictionary of the estimates and the low and high ends of their intervals. if no Powerboard failed, the bootstrap interval of the failure fraction is [0, 0], so its high end is replaced by the exact binomial bound, the fraction at which no failure in n Powerboards has a probability of (1 - confidence) / 2, about 3.7 / n at 95%. likewise, if every Powerboard failed, its low end is replaced by the fraction at which all n failing has that probability
+
+def bootstrap_task(task):
+    vals, failed, threshold, threshold_dir, resamples, confidence, seed = task
+    n = len(failed)
+    result = {"n": n}
+    rng = np.random.default_rng(seed)
+    statistics = ["median", "sigma", "cpk", "fail_fraction"] if vals is not None else ["fail_fraction"]
+    estimates = {statistic: np.empty(resamples if n > 0 else 0) for statistic in statistics}
+    if vals is not None and n > 0:
+        order = np.argsort(vals, kind = "stable")
+        center = np.mean(vals)
+        sorted_vals = vals[order] - center
+        failed = failed[order]
+    batch = max(1, batch_elements // max(n, 1))
+    for start in range(0, len(estimates["fail_fraction"]), batch):
+        rows = slice(start, min(start + batch, resamples))
+        index = rng.integers(0, n, size = (rows.stop - rows.start, n), dtype = np.int32)
+        estimates["fail_fraction"][rows] = np.count_nonzero(np.take(failed, index), axis = 1) / n
+        if vals is not None:
+            index.sort(axis = 1)
+            sample = np.take(sorted_vals, index)
+            mean = sample.sum(axis = 1) / n
+            estimates["median"][rows] = center + 0.5 * (sample[:, (n - 1) // 2] + sample[:, n // 2])
+            estimates["sigma"][rows] = np.sqrt(np.maximum(np.einsum("ij,ij->i", sample, sample) / n - mean ** 2, 0))
+            estimates["cpk"][rows] = cpk(center + mean, estimates["sigma"][rows], threshold, threshold_dir)
+
+    point = {"fail_fraction": float(np.count_nonzero(failed) / n) if n > 0 else np.nan}
+    if vals is not None:
+        point["median"] = float(np.median(vals)) if n > 0 else np.nan
+        point["sigma"] = float(np.std(vals)) if n > 0 else np.nan
+        point["cpk"] = float(cpk(np.mean(vals), point["sigma"], threshold, threshold_dir)) if n > 0 else np.nan
+    for statistic in ["median", "sigma", "cpk", "fail_fraction"]:
+        low, high = interval(estimates[statistic], confidence) if statistic in estimates else (np.nan, np.nan)
+        result[statistic] = point.get(statistic, np.nan)
+        result[statistic + "_low"] = low
+        result[statistic + "_high"] = high
+    if n > 0 and point["fail_fraction"] == 0:
+        result["fail_fraction_high"] = 1 - ((1 - confidence) / 2) ** (1 / n)
+    if n > 0 and point["fail_fraction"] == 1:
+        result["fail_fraction_low"] = ((1 - confidence) / 2) ** (1 / n)
+    return result
+
+# statistics of every (stage, temperature, variable, state) of a table, and of all variables of each stage together ("variable" "all variables"), as a dictionary of arrays with one row each: "stage", "temp", "variable", "state", "n" (number of Powerboards), and "median", "sigma", "cpk", "fail_fraction", each with "_low" and "_high" for the ends of its confidence interval. whether a value fails is decided by the current thresholds in "params" ("evaluate_thresholds"). the variables are computed by "workers" processes
+
+def capability_table(table, resamples = 10000, confidence = 0.95, seed = 1, workers = 1):
+    passed, failures = prod_plot.evaluate_thresholds(table)
+    keys = []
+    tasks = []
+    for (stage, temp, val_name, state), rows in group_rows(table, ["stage", "temp", "variable", "state"]):
+        if val_name not in prod_plot.params:
+            continue
+        threshold, threshold_dir, title, xlabel = prod_plot.variable_settings(val_name, state or None, temp or None)
+        if prod_plot.params[val_name]["offon"] == True and prod_plot.params[val_name].get("state_threshold") is not None:
+            threshold = None
+        keys.append((stage, temp, val_name, state))
+        tasks.append([np.asarray(table["value"][rows], dtype = np.float64), ~passed[rows], threshold, threshold_dir])
+    for (stage,), rows in group_rows(table, ["stage"]):
+        codes, board = np.unique(table["code"][rows], return_inverse = True)
+        board_failed = np.zeros(len(codes), dtype = bool)
+        np.logical_or.at(board_failed, board.reshape(-1), ~passed[rows])
+        keys.append((stage, "", "all variables", ""))
+        tasks.append([None, board_failed, None, None])
+
+    seeds = np.random.SeedSequence(seed).spawn(len(tasks))
+    tasks = [tuple(task) + (resamples, confidence, task_seed) for task, task_seed in zip(tasks, seeds)]
+    if workers > 1 and len(tasks) > 1:
+        with concurrent.futures.ProcessPoolExecutor(max_workers = min(workers, len(tasks))) as executor:
+            results = list(executor.map(bootstrap_task, tasks))
+    else:
+        results = [bootstrap_task(task) for task in tasks]
+
+    columns = {column: np.array([key[n] for key in keys]) for n, column in enumerate(["stage", "temp", "variable", "state"])}
+    for column in results[0] if len(results) > 0 else []:
+        columns[column] = np.array([result[column] for result in results])
+    return columns
+
+def format_interval(value, low, high, scale = 1, digits = ".3g"):
+    if np.isnan(value):
+        return "-"
+    return f"{value * scale:{digits}} [{low * scale:{digits}}, {high * scale:{digits}}]"
+
+# command line interface, e.g. for the statistics of every variable after Burn-In, and the number of the next 500 Powerboards expected to fail:
+
+#     python prod_plot.py --stage Burn-In --all-variables --values-dir values
+#     python capability.py values --remaining 500
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = "Bootstrap confidence intervals of the median, sigma and failure fraction of every QC variable, the process capability Cpk against the thresholds, and the projected yield, from the values saved with prod_plot.py --values-dir.")
+    parser.add_argument("values_dir", help = "directory of a value table saved with prod_plot.py --values-dir")
+    parser.add_argument("--stage", default = None, help = "only use the values of this stage (default: every stage in the table)")
+    parser.add_argument("--resamples", type = int, default = 10000, help = "number of bootstrap resamples of every variable (default: 10000)")
+    parser.add_argument("--confidence", type = float, default = 0.95, help = "confidence level of the intervals (default: 0.95)")
+    parser.add_argument("--seed", type = int, default = 1, help = "seed of the resampling (default: 1)")
+    parser.add_argument("--workers", type = int, default = os.cpu_count() or 1, help = "number of processes computing the variables (default: number of CPUs)")
+    parser.add_argument("--remaining", type = int, default = None, help = "number of Powerboards not yet tested, for which the number expected to fail is projected")
+    parser.add_argument("--table-dir", default = None, help = "directory the statistics are saved to as a table of .npy columns")
+    args = parser.parse_args(argv)
+    if not 0 < args.confidence < 1:
+        parser.error("--confidence must lie between 0 and 1")
+
+    table = load_table(args.values_dir)
+    if args.stage is not None:
+        table = select(table, stage = prod_plot.stages.get(args.stage, args.stage))
+    stats = capability_table(table, resamples = args.resamples, confidence = args.confidence, seed = args.seed, workers = args.workers)
+    if len(stats["variable"]) == 0:
+        print("No values found.")
+        return
+
+    print(f"{args.confidence:.0%} bootstrap confidence intervals from {args.resamples} resamples\n")
+    print(f"{'variable':<40} {'n':>5}  {'median':<30} {'sigma':<30} {'Cpk':<22} failed %")
+    for row in range(len(stats["variable"])):
+        if stats["variable"][row] == "all variables":
+            continue
+        name = " ".join(part for part in [stats["stage"][row], stats["temp"][row], stats["variable"][row], stats["state"][row]] if part != "")
+        print(f"{name:<40} {stats['n'][row]:5d}  {format_interval(stats['median'][row], stats['median_low'][row], stats['median_high'][row]):<30} {format_interval(stats['sigma'][row], stats['sigma_low'][row], stats['sigma_high'][row]):<30} {format_interval(stats['cpk'][row], stats['cpk_low'][row], stats['cpk_high'][row], digits = '.2f'):<22} {format_interval(stats['fail_fraction'][row], stats['fail_fraction_low'][row], stats['fail_fraction_high'][row], scale = 100, digits = '.2f')}")
+
+    print("\nprojected yield (Powerboards passing every variable):")
+    for row in np.flatnonzero(stats["variable"] == "all variables"):
+        fraction, low, high = stats["fail_fraction"][row], stats["fail_fraction_low"][row], stats["fail_fraction_high"][row]
+        line = f"{stats['stage'][row]}: {stats['n'][row]} Powerboards, yield {format_interval(1 - fraction, 1 - high, 1 - low, scale = 100, digits = '.1f')} %"
+        if args.remaining is not None:
+            line += f", {format_interval(fraction, low, high, scale = args.remaining, digits = '.1f')} of the next {args.remaining} expected to fail"
+        print(line)
+
+    if args.table_dir is not None:
+        save_table(args.table_dir, stats)
+        print(f"\nstatistics of {len(stats['variable'])} variables saved to {args.table_dir}")
+
+if __name__ == "__main__":
+    main()
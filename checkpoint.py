@@ -0,0 +1,27 @@
+import os
+import json
+import tempfile
+
+# checkpoints of a long download, saved as JSON. a checkpoint is first written to a temporary file in the same directory and then moved over the previous one, so a crash while saving leaves the previous checkpoint intact
+
+def save_checkpoint(path, state):
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok = True)
+    fd, tmp_path = tempfile.mkstemp(dir = directory, prefix = ".checkpoint-", suffix = ".tmp")
+    try:
+        with os.fdopen(fd, "w") as f:
+            json.dump(state, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+# load a checkpoint, or return None if there is none yet
+
+def load_checkpoint(path):
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
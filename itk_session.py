@@ -0,0 +1,243 @@
+import itkdb
+import itkdb.exceptions
+import requests
+import http.client
+import time
+import random
+import threading
+from profiling import timers
+
+# single request layer used for every call to the ITk database. every request goes through "ITkSession.get", which reauthenticates if needed, waits for the shared rate limiter, applies a per-endpoint timeout, retries failed requests with exponential backoff and jitter, and records per-endpoint metrics
+
+# connection errors, timeouts and server errors (HTTP 500/502/503/504) are retried. any other error, and a request that still fails after max_retries attempts, is raised to the caller
+
+retry_exceptions = (requests.exceptions.ConnectionError, requests.exceptions.Timeout, http.client.RemoteDisconnected, itkdb.exceptions.ServerError)
+
+# timeout in seconds of a single request to each endpoint. "getTestRunBulk" returns whole chunks of test runs, so it is given the longest time
+
+default_timeouts = {
+    "listComponents": 60,
+    "listTestRunsByComponent": 60,
+    "getTestRunBulk": 180
+}
+
+# upper edges in seconds of the latency histogram bins recorded for every endpoint. the last bin collects all slower requests
+
+latency_bins = [0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0]
+
+# class limiting the rate of requests sent to the database. every request, from any thread, first waits for its turn, and turns are spaced at least 1/max_rps seconds apart
+
+class RateLimiter:
+    def __init__(self, max_rps):
+        self.interval = 1.0 / max_rps if max_rps > 0 else 0.0
+        self.next_time = time.monotonic()
+        self.lock = threading.Lock()
+
+    def wait(self):
+        if self.interval == 0.0:
+            return
+        with self.lock:
+            now = time.monotonic()
+            turn = max(now, self.next_time)
+            self.next_time = turn + self.interval
+        if turn > now:
+            time.sleep(turn - now)
+
+# class collecting, for every endpoint, the number of requests, retried attempts and requests that failed after all attempts, the total time spent, a histogram of request latencies, and the number of bytes received. it is shared by all download threads
+
+class EndpointMetrics:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.endpoints = {}
+
+    def _endpoint(self, endpoint):
+        if endpoint not in self.endpoints:
+            self.endpoints[endpoint] = {
+                "requests": 0,
+                "retries": 0,
+                "failures": 0,
+                "seconds": 0.0,
+                "bytes": 0,
+                "latency_hist": [0 for i in range(len(latency_bins) + 1)]
+            }
+        return self.endpoints[endpoint]
+
+    # record one attempt of a request, successful or not
+
+    def record(self, endpoint, seconds, retried = False):
+        bin_index = len(latency_bins)
+        for i, edge in enumerate(latency_bins):
+            if seconds <= edge:
+                bin_index = i
+                break
+        with self.lock:
+            metrics = self._endpoint(endpoint)
+            metrics["requests"] += 1
+            metrics["seconds"] += seconds
+            metrics["latency_hist"][bin_index] += 1
+            if retried:
+                metrics["retries"] += 1
+
+    def record_failure(self, endpoint):
+        with self.lock:
+            self._endpoint(endpoint)["failures"] += 1
+
+    def record_bytes(self, endpoint, n_bytes):
+        with self.lock:
+            self._endpoint(endpoint)["bytes"] += n_bytes
+
+    # return a copy of the metrics of every endpoint, with the mean latency added
+
+    def summary(self):
+        with self.lock:
+            summary = {}
+            for endpoint, metrics in self.endpoints.items():
+                summary[endpoint] = dict(metrics, latency_hist = list(metrics["latency_hist"]))
+                summary[endpoint]["mean_seconds"] = metrics["seconds"] / metrics["requests"] if metrics["requests"] > 0 else 0.0
+            return summary
+
+    # print one line per endpoint
+
+    def report(self):
+        for endpoint, metrics in self.summary().items():
+            print(f"{endpoint}: {metrics['requests']} requests, {metrics['retries']} retried, {metrics['failures']} failed, {metrics['seconds']:.1f} s ({metrics['mean_seconds']:.3f} s mean), {metrics['bytes'] / 1e6:.2f} MB")
+            print("    latency histogram (s): " + ", ".join(f"<={edge}: {count}" for edge, count in zip(latency_bins + [">"], metrics["latency_hist"]) if count > 0))
+
+# class holding an authenticated itkdb user, the "Client" instances used to send requests, the rate limiter and the metrics shared by all of them. the access codes are kept so that the user can be reauthenticated during long downloads
+
+# every thread keeps its own "Client" for the whole download, so each thread reuses a pool of open connections to the database instead of connecting again for every request
+
+# the expiry time of the authentication is tracked here, so checking it before a request is a single comparison. the user is reauthenticated refresh_margin seconds before it expires: lazily by the first request after that time, or proactively by a background thread if background_refresh = True. a request answered with HTTP 401 (unauthorized) also reauthenticates once and is sent again. all threads share the same user, and a new authentication is made only once however many threads notice the expiry at the same time
+
+# the itkdb user and "Client" are created by user_factory(code1, code2) and client_factory(user = user), which default to the itkdb classes. other factories can be given to run against a stand-in database, see mock_itkdb.py
+
+class ITkSession:
+    def __init__(self, code1, code2, max_rps = 10.0, max_retries = 5, retry_delay = 1.0, max_retry_delay = 60.0, timeouts = None, refresh_margin = 300, background_refresh = False, user_factory = None, client_factory = None):
+        self.code1 = code1
+        self.code2 = code2
+        self.user_factory = user_factory if user_factory is not None else itkdb.core.User
+        self.client_factory = client_factory if client_factory is not None else itkdb.Client
+        self.refresh_margin = refresh_margin
+        self.rate_limiter = RateLimiter(max_rps)
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+        self.timeouts = dict(default_timeouts, **(timeouts or {}))
+        self.metrics = EndpointMetrics()
+        self.auth_lock = threading.Lock()
+        self.thread_clients = threading.local()
+        self.stop_refresh = threading.Event()
+        self.authenticate()
+        print('itkdb authenticate will expire in : '+str(self.user.expires_in) + ' s')
+        if background_refresh:
+            threading.Thread(target = self.refresh_loop, name = "itkdb-refresh", daemon = True).start()
+
+    # authenticate itkdb and create an instance of the "Client" class from the itkdb module
+
+    def authenticate(self):
+        user = self.user_factory(self.code1, self.code2)
+        with timers.phase("authentication"):
+            user.authenticate()
+        if not user.is_authenticated():
+            raise RuntimeError("itkdb login unsuccessful")
+        print('itkdb login successful!')
+        self.refresh_at = time.time() + user.expires_in - self.refresh_margin
+        self.client = self.new_client_for(user)
+        self.user = user
+
+    # create a "Client" for a user, counting the bytes of every response it receives
+
+    def new_client_for(self, user):
+        client = self.client_factory(user = user)
+        client.hooks["response"].append(self.record_response)
+        return client
+
+    def record_response(self, response, *args, **kwargs):
+        endpoint = response.url.split("?")[0].rstrip("/").rsplit("/", 1)[-1]
+        self.metrics.record_bytes(endpoint, len(response.content or b""))
+
+    # reauthenticate if the authentication expires within refresh_margin seconds (5 minutes by default). the time is checked again after taking the lock, so threads waiting for the lock while another one reauthenticates do not reauthenticate again
+
+    def reauthenticate(self):
+        if time.time() < self.refresh_at:
+            return
+        with self.auth_lock:
+            if time.time() < self.refresh_at:
+                return
+            print('itkdb login: less than 5 mins left before expires => get new authentication now.')
+            self.authenticate()
+
+    # reauthenticate after a request made with "stale_user" was unauthorized, unless another thread already did
+
+    def refresh(self, stale_user):
+        with self.auth_lock:
+            if self.user is stale_user:
+                print('itkdb login: request unauthorized => get new authentication now.')
+                self.authenticate()
+
+    # background thread sleeping until the authentication is due to be renewed. if reauthenticating fails, it is tried again a minute later, and requests keep reauthenticating lazily in the meantime
+
+    def refresh_loop(self):
+        while not self.stop_refresh.wait(max(1.0, self.refresh_at - time.time())):
+            try:
+                self.reauthenticate()
+            except Exception as e:
+                print(f"itkdb login: background reauthentication failed ({e}), trying again in 60 s")
+                if self.stop_refresh.wait(60):
+                    return
+
+    def close(self):
+        self.stop_refresh.set()
+
+    # return the "Client" used by the calling thread. the main thread uses the main client, and every download thread gets its own client, which is recreated whenever the user has been reauthenticated
+
+    def get_client(self):
+        if threading.current_thread() is threading.main_thread():
+            return self.client
+        user = self.user
+        if getattr(self.thread_clients, "user", None) is not user:
+            self.thread_clients.user = user
+            self.thread_clients.client = self.new_client_for(user)
+        return self.thread_clients.client
+
+    # waiting time before the next attempt: exponential backoff, capped at max_retry_delay, with random jitter so that concurrent threads do not retry at the same moment
+
+    def backoff(self, attempt):
+        delay = min(self.max_retry_delay, self.retry_delay * 2 ** (attempt - 1))
+        return delay / 2 + random.uniform(0, delay / 2)
+
+    # send a request to an endpoint and return its result. paged results are read completely within the same attempt, unless all_pages = False, in which case only the first page is received and the paged result is returned as it is
+
+    def get(self, endpoint, all_pages = True, **kwargs):
+        kwargs.setdefault("timeout", self.timeouts.get(endpoint, 60))
+        unauthorized = False
+        for attempt in range(1, self.max_retries + 1):
+            self.reauthenticate()
+            self.rate_limiter.wait()
+            user = self.user
+            start = time.perf_counter()
+            try:
+                result = self.get_client().get(endpoint, **kwargs)
+                if all_pages and hasattr(result, "page_info"):
+                    result = list(result)
+            except itkdb.exceptions.Forbidden as e:
+                if getattr(e.response, "status_code", None) != 401 or unauthorized or attempt == self.max_retries:
+                    self.metrics.record(endpoint, time.perf_counter() - start)
+                    self.metrics.record_failure(endpoint)
+                    raise
+                unauthorized = True
+                self.metrics.record(endpoint, time.perf_counter() - start, retried = True)
+                self.refresh(user)
+                continue
+            except retry_exceptions as e:
+                if attempt == self.max_retries:
+                    self.metrics.record(endpoint, time.perf_counter() - start)
+                    self.metrics.record_failure(endpoint)
+                    raise
+                self.metrics.record(endpoint, time.perf_counter() - start, retried = True)
+                delay = self.backoff(attempt)
+                print(f"Attempt {attempt}: {endpoint} failed ({type(e).__name__}). Retrying in {delay:.1f} seconds...")
+                time.sleep(delay)
+                continue
+            self.metrics.record(endpoint, time.perf_counter() - start)
+            return result
@@ -0,0 +1,211 @@
+import json
+import time
+import random
+import datetime
+import threading
+import requests
+import prod_plot
+
+# local stand-in for the ITk database, used to measure the download and extraction offline (see benchmark.py). "MockDatabase" serves synthetic "listComponents", "listTestRunsByComponent" and "getTestRunBulk" results through "MockClient", which takes the place of "itkdb.Client" in "ITkSession":
+
+#     database = MockDatabase(boards = 1000, latency = 0.05)
+#     session = ITkSession("", "", user_factory = database.user, client_factory = database.client)
+
+# the dataset has "boards" components, of which every tenth is not a production Powerboard. every production Powerboard has, at every stage, temperature_runs "Temperatures" tests, alternately warm and cold ("Thermal Cycling" is only warm), each followed by test_runs repetitions of every other test in "params" a minute apart. the values are random, mostly within the thresholds of "params"
+
+# nothing is stored: every test run is generated again from its id whenever it is requested, so the memory used by the stand-in does not count towards that of the download being measured, and the same seed always gives the same dataset
+
+# every request waits latency seconds, plus latency_per_run seconds for every test run returned, and fails with a connection error with probability failure_rate. results are sent through JSON, as by the real database, and the response hooks of the client receive the size of every response
+
+stage_codes = ["BONDED", "THERMAL", "BURN_IN"]
+
+# tests in the order they are run after each "Temperatures" test
+
+test_types = list(dict.fromkeys(val_params["test_type"] for val_params in prod_plot.params.values() if val_params["test_type"] != "Temperatures"))
+
+def iso_time(unix_time):
+    return datetime.datetime.fromtimestamp(unix_time, datetime.timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%f")[:-3] + "Z"
+
+# random value of a variable, within its threshold most of the time
+
+def synthetic_value(rng, threshold, threshold_dir):
+    if isinstance(threshold, list):
+        return threshold[0] + (threshold[1] - threshold[0]) * rng.uniform(-0.05, 1.05)
+    elif threshold is None:
+        return rng.uniform(0, 1)
+    elif threshold_dir == "less":
+        return threshold - abs(threshold) * rng.uniform(-0.05, 1)
+    elif threshold_dir == "more":
+        return threshold + abs(threshold) * rng.uniform(-0.05, 0.5)
+    return threshold if rng.random() > 0.02 else threshold + 1
+
+class MockDatabase:
+    def __init__(self, boards = 100, test_runs = 1, temperature_runs = 2, stages = None, latency = 0.0, latency_per_run = 0.0, failure_rate = 0.0, seed = 1, token_lifetime = 7200):
+        self.boards = boards
+        self.test_runs = test_runs
+        self.temperature_runs = temperature_runs
+        self.stages = stages if stages is not None else stage_codes
+        self.latency = latency
+        self.latency_per_run = latency_per_run
+        self.failure_rate = failure_rate
+        self.seed = seed
+        self.token_lifetime = token_lifetime
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.requests = {}
+        self.failures = {}
+
+    def user(self, code1 = None, code2 = None):
+        return MockUser(self.token_lifetime)
+
+    def client(self, user = None, **kwargs):
+        return MockClient(self, user)
+
+    def component(self, board):
+        serial = f"20USBP05{board:06d}" if board % 10 != 9 else f"20USBP04{board:06d}"
+        return {"code": f"mock{board:06d}", "serialNumber": serial}
+
+    def production_boards(self):
+        return sum(1 for board in range(self.boards) if board % 10 != 9)
+
+    def temperatures(self, stage):
+        return ["Warm"] if stage == "THERMAL" else ["Warm", "Cold"]
+
+    # ids and upload times of the test runs of one component at one stage. a test run id encodes the board, stage, temperature run, repetition and test, so the test run can be generated from it alone
+
+    def run_list(self, code, stage):
+        board = int(code[len("mock"):])
+        if board >= self.boards or board % 10 == 9 or stage not in self.stages:
+            return []
+        runs = []
+        for k in range(self.temperature_runs):
+            runs.append(f"{board}.{stage}.{k}.0.T")
+            for repeat in range(self.test_runs):
+                for j in range(len(test_types)):
+                    runs.append(f"{board}.{stage}.{k}.{repeat}.{j}")
+        return [(run_id, self.run_time(run_id)) for run_id in runs]
+
+    # upload time of a test run: each board is tested on its own day, temperature runs are two hours apart, and the tests of a temperature run follow its "Temperatures" test within ten minutes
+
+    def run_time(self, run_id):
+        board, stage, k, repeat, test = run_id.split(".")
+        base = 1.7e9 + int(board) * 86400 + stage_codes.index(stage) * 30 * 86400 + int(k) * 7200
+        if test == "T":
+            return base
+        return base + 20 * (int(test) + 1) + 60 * int(repeat)
+
+    def test_run(self, run_id):
+        board, stage, k, repeat, test = run_id.split(".")
+        temp = self.temperatures(stage)[int(k) % len(self.temperatures(stage))]
+        unix_time = self.run_time(run_id)
+        rng = random.Random(f"{self.seed}:{run_id}")
+        if test == "T":
+            test_type = "Temperatures"
+            results = [{"name": "CTAToffsetX", "value": 0}, {"name": "CTAToffsetY", "value": 0}, {"name": "CTAToffset", "value": 4 if temp == "Warm" else 8}]
+        else:
+            test_type = test_types[int(test)]
+            results = []
+        results += self.results(rng, test_type, temp if stage != "THERMAL" else None)
+        return {"id": run_id, "testType": {"code": test_type.upper().replace(" ", "_"), "name": test_type}, "stateTs": iso_time(unix_time), "date": iso_time(unix_time), "results": results}
+
+    # random results of one test, with one result for every variable of "params" measured in it
+
+    def results(self, rng, test_type, temp):
+        results = []
+        vout = None
+        for val_name, val_params in prod_plot.params.items():
+            if val_params["test_type"] != test_type:
+                continue
+            if val_name in prod_plot.adjust_index:
+                if vout is None:
+                    vout = [1.5, 0.0, 0.0, 0.0]
+                    results += [{"name": "ADJ_SETTING", "value": [0, 1, 2, 3]}, {"name": "VIN", "value": 11.0}, {"name": "VOUT", "value": vout}]
+                threshold, threshold_dir, title, xlabel = prod_plot.variable_settings(val_name, None, temp)
+                vout[prod_plot.adjust_index[val_name]] = vout[0] * (1 + synthetic_value(rng, threshold, threshold_dir) / 100)
+                continue
+            if val_params["offon"] == True:
+                if val_name == "HVIIN":
+                    val_off = rng.uniform(0, 1)
+                    val = [val_off, val_off + (val_params.get("state_threshold") or 0) + rng.uniform(-0.05, 1)]
+                else:
+                    val = [synthetic_value(rng, *prod_plot.variable_settings(val_name, state, temp)[:2]) for state in ["OFF", "ON"]]
+                if val_name in prod_plot.swapped_offon:
+                    val.reverse()
+            else:
+                val = synthetic_value(rng, *prod_plot.variable_settings(val_name, None, temp)[:2])
+                if val_name == "EFFICIENCY":
+                    val = [val / 100 * (0.8 + 0.02 * load) for load in range(10)] + [val / 100, val / 100 * 0.99]
+            results.append({"name": val_name, "value": val})
+        return results
+
+    # count a request, and decide whether it fails
+
+    def request(self, endpoint):
+        with self.lock:
+            self.requests[endpoint] = self.requests.get(endpoint, 0) + 1
+            failed = self.rng.random() < self.failure_rate
+            if failed:
+                self.failures[endpoint] = self.failures.get(endpoint, 0) + 1
+        return failed
+
+    # results of one request, as returned by the itkdb "Client"
+
+    def serve(self, endpoint, data):
+        if endpoint == "listComponents":
+            page_info = data.get("pageInfo", {"pageIndex": 0, "pageSize": self.boards})
+            first = page_info["pageIndex"] * page_info["pageSize"]
+            return [self.component(board) for board in range(first, min(first + page_info["pageSize"], self.boards))]
+        if endpoint == "listTestRunsByComponent":
+            stages = data.get("stage", self.stages)
+            stages = [stages] if isinstance(stages, str) else stages
+            return [{"id": run_id, "stateTs": iso_time(unix_time)} for stage in stages for run_id, unix_time in self.run_list(data["component"], stage)]
+        if endpoint == "getTestRunBulk":
+            return [self.test_run(run_id) for run_id in data["testRun"]]
+        raise requests.exceptions.HTTPError(f"mock ITk database: unknown endpoint {endpoint}")
+
+class MockUser:
+    def __init__(self, token_lifetime):
+        self.token_lifetime = token_lifetime
+        self.expires_at = 0
+
+    def authenticate(self):
+        self.expires_at = time.time() + self.token_lifetime
+        return True
+
+    def is_authenticated(self):
+        return self.expires_at > 0
+
+    def is_expired(self):
+        return time.time() >= self.expires_at
+
+    @property
+    def expires_in(self):
+        return max(0, int(self.expires_at - time.time()))
+
+# response passed to the response hooks of "MockClient"
+
+class MockResponse:
+    def __init__(self, url, content):
+        self.url = url
+        self.content = content
+        self.status_code = 200
+
+class MockClient:
+    def __init__(self, database, user = None):
+        self.database = database
+        self.user = user
+        self.hooks = {"response": []}
+
+    def get(self, endpoint, **kwargs):
+        database = self.database
+        failed = database.request(endpoint)
+        result = database.serve(endpoint, kwargs.get("json") or {})
+        delay = database.latency + database.latency_per_run * (len(result) if endpoint == "getTestRunBulk" else 0)
+        if delay > 0:
+            time.sleep(delay)
+        if failed:
+            raise requests.exceptions.ConnectionError(f"mock ITk database: {endpoint} failed")
+        content = json.dumps(result).encode()
+        for hook in self.hooks["response"]:
+            hook(MockResponse(f"mock://itkdb/{endpoint}", content))
+        return json.loads(content)
@@ -0,0 +1,180 @@
+import argparse
+import os
+import numpy as np
+import prod_plot
+from value_store import load_table, save_table, select, group_rows
+from plot_render import formats, draw_correlation, render_plots
+
+# fleet-wide outlier search over all QC variables of every Powerboard, computed from a value table saved with "--all-variables --values-dir" (see value_store.py), so a Powerboard lying just inside the thresholds of many correlated variables (e.g. CALx/CALy, NTCx/NTCy/NTCpb, CTAT/PTAT) can be found, although it does not stand out in any single histogram
+
+# the values are arranged in a matrix with one row per Powerboard and one column per (stage, temperature, variable, state). every column is standardised with robust z-scores, (value - median) / (1.4826 * median absolute deviation), so the spread of the bulk of the Powerboards is 1 whatever the outliers. for columns where more than half of the Powerboards have the same value, e.g. PADID, the mean absolute deviation (times 1.2533) is used instead, and columns without any spread are left out. such mostly constant columns count for the robust z-scores of single values, but not for the multivariate score, where any deviation from the common value would outweigh all continuous variables
+
+# the multivariate outlier score of every Powerboard is its squared Mahalanobis distance from the bulk of the fleet, with a robust centre and covariance found by concentration steps, as in the minimum covariance determinant estimator: starting from the Powerboards closest to the medians, the mean and covariance of the "support" fraction of Powerboards closest to the current estimate are computed again until that fraction no longer changes. a small ridge keeps the covariance invertible when variables are constant within the bulk or exactly collinear. missing values are set to the median of their column, so they do not add to the distance. the flagging limit assumes many more Powerboards than variables: with fewer than about ten Powerboards per variable, the covariance is fitted too closely to the bulk, and the distances of the other Powerboards, and the number flagged, are too large. everything is computed on whole arrays, so the fleet size only enters through matrix products
+
+# robust z-score beyond which a single value counts as outlying (Iglewicz and Hoaglin)
+
+z_outlier = 3.5
+
+# standard normal quantile of the fraction of Powerboards whose Mahalanobis distance is expected below the flagging limit (99.9%)
+
+flag_z = 3.090
+
+def column_name(key):
+    return " ".join(part for part in key if part != "")
+
+# the values of a table as a (Powerboards, columns) matrix, with NaN where a Powerboard has no value. returns the id codes and serial numbers of the rows, the names of the columns (without the stage if there is only one) and the matrix. columns measured for less than min_fraction of the Powerboards are left out. of several values of the same Powerboard and column, the last one in the table is used
+
+def value_matrix(table, stage = None, min_fraction = 0.5):
+    if stage is not None:
+        table = select(table, stage = stage)
+    codes, board = np.unique(table["code"], return_inverse = True)
+    board = board.reshape(-1)
+    serial_numbers = np.empty(len(codes), dtype = table["serialNumber"].dtype)
+    serial_numbers[board] = table["serialNumber"]
+
+    groups = group_rows(table, ["stage", "temp", "variable", "state"])
+    matrix = np.full((len(codes), len(groups)), np.nan)
+    for column, (key, rows) in enumerate(groups):
+        matrix[board[rows], column] = table["value"][rows]
+    single_stage = len(np.unique(table["stage"])) <= 1
+    names = [column_name(key[1:] if single_stage else key) for key, rows in groups]
+
+    measured = np.mean(~np.isnan(matrix), axis = 0) >= min_fraction if len(codes) > 0 else np.zeros(len(groups), dtype = bool)
+    return codes, serial_numbers, [name for name, keep in zip(names, measured) if keep], matrix[:, measured]
+
+# robust z-scores of every column of a matrix, a mask of the columns that have a spread (only these are returned), and a mask of the returned columns whose median absolute deviation is not 0
+
+def robust_z(matrix):
+    center = np.nanmedian(matrix, axis = 0)
+    deviation = np.abs(matrix - center)
+    mad_scale = 1.4826 * np.nanmedian(deviation, axis = 0)
+    scale = np.where(mad_scale > 0, mad_scale, 1.2533 * np.nanmean(deviation, axis = 0))
+    varies = scale > 0
+    return (matrix[:, varies] - center[varies]) / scale[varies], varies, mad_scale[varies] > 0
+
+# correlation matrix of the columns of a matrix of z-scores. the z-scores are clipped at z_outlier, so that a few outliers do not dominate the correlations, and missing values count as the median
+
+def correlation(z):
+    clipped = np.clip(np.nan_to_num(z, nan = 0.0), -z_outlier, z_outlier)
+    centred = clipped - clipped.mean(axis = 0)
+    covariance = centred.T @ centred
+    sigma = np.sqrt(np.diag(covariance))
+    with np.errstate(invalid = "ignore", divide = "ignore"):
+        return np.nan_to_num(covariance / np.outer(sigma, sigma))
+
+# squared Mahalanobis distance of every row from a centre, for a covariance matrix
+
+def mahalanobis(x, mean, covariance):
+    centred = x - mean
+    return np.sum(centred * np.linalg.solve(covariance, centred.T).T, axis = 1)
+
+# Wilson-Hilferty approximation of the quantile of the chi-squared distribution with k degrees of freedom, at the standard normal quantile z, e.g. z = 0 for the median
+
+def chi2_quantile(z, k):
+    return k * (1 - 2 / (9 * k) + z * np.sqrt(2 / (9 * k))) ** 3
+
+# robust centre and covariance of the rows of a matrix of z-scores without missing values. the covariance is scaled so that the median distance matches the median of the chi-squared distribution, as it would for normally distributed values. the estimate is finally computed again from all Powerboards within the 97.5% quantile of the distance (reweighting), which makes it less noisy than the estimate from the support fraction alone
+
+def robust_covariance(z, support = 0.75, steps = 20, ridge = 0.01):
+    n, k = z.shape
+    h = min(n, max(int(support * n), k + 1))
+
+    def estimate(rows):
+        mean = z[rows].mean(axis = 0)
+        covariance = np.atleast_2d(np.cov(z[rows], rowvar = False)) + ridge * np.eye(k) if len(rows) > 1 else np.eye(k)
+        distance = mahalanobis(z, mean, covariance)
+        return mean, covariance * np.median(distance) / chi2_quantile(0.0, k), distance
+
+    subset = np.sort(np.argsort(np.sum(z ** 2, axis = 1), kind = "stable")[:h])
+    for step in range(steps):
+        mean, covariance, distance = estimate(subset)
+        new_subset = np.sort(np.argsort(distance, kind = "stable")[:h])
+        if np.array_equal(new_subset, subset):
+            break
+        subset = new_subset
+    mean, covariance, distance = estimate(np.flatnonzero(mahalanobis(z, mean, covariance) <= chi2_quantile(1.960, k)))
+    return mean, covariance
+
+# outlier scores of every Powerboard in a table, as a dictionary of arrays sorted from the most to the least suspicious Powerboard: "code", "serialNumber", "distance" (squared Mahalanobis distance over the continuous variables), "flagged" (distance beyond the 99.9% quantile expected for normally distributed values), "measured" (number of variables with a value), "outlying" (number of variables with a robust z-score beyond z_outlier), and the variable with the largest robust z-score ("worst_variable", "worst_z"). also returns the names of the variables used, their correlation matrix, and the distance beyond which Powerboards are flagged
+
+def board_scores(table, stage = None, min_fraction = 0.5, support = 0.75):
+    codes, serial_numbers, names, matrix = value_matrix(table, stage = stage, min_fraction = min_fraction)
+    z, varies, continuous = robust_z(matrix)
+    names = [name for name, keep in zip(names, varies) if keep]
+    if len(codes) == 0 or not continuous.any():
+        return None, names, np.zeros((len(names), len(names))), None
+
+    filled = np.nan_to_num(z, nan = 0.0)
+    mean, covariance = robust_covariance(filled[:, continuous], support = support)
+    distance = mahalanobis(filled[:, continuous], mean, covariance)
+    limit = chi2_quantile(flag_z, int(continuous.sum()))
+    worst = np.argmax(np.abs(filled), axis = 1)
+    order = np.argsort(-distance, kind = "stable")
+    scores = {
+        "code": codes,
+        "serialNumber": serial_numbers,
+        "distance": distance,
+        "flagged": distance > limit,
+        "measured": np.sum(~np.isnan(z), axis = 1),
+        "outlying": np.sum(np.abs(filled) > z_outlier, axis = 1),
+        "worst_variable": np.array(names)[worst],
+        "worst_z": filled[np.arange(len(codes)), worst]
+    }
+    return {column: values[order] for column, values in scores.items()}, names, correlation(z), limit
+
+# the most strongly correlated pairs of variables, as (correlation, name, name) tuples sorted by absolute correlation
+
+def strongest_pairs(corr, names, count = 10):
+    first, second = np.triu_indices(len(names), k = 1)
+    order = np.argsort(-np.abs(corr[first, second]), kind = "stable")[:count]
+    return [(corr[first[n], second[n]], names[first[n]], names[second[n]]) for n in order]
+
+# command line interface, e.g. for the 50 most suspicious Powerboards after Burn-In:
+
+#     python prod_plot.py --stage Burn-In --all-variables --values-dir values
+#     python outliers.py values --top 50 --output-dir outliers
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = "Rank Powerboards by how far their values of all QC variables lie from the rest of the fleet, from the values saved with prod_plot.py --all-variables --values-dir.")
+    parser.add_argument("values_dir", help = "directory of a value table saved with prod_plot.py --values-dir")
+    parser.add_argument("--stage", default = None, help = "only use the values of this stage (default: every stage in the table, as separate variables)")
+    parser.add_argument("--top", type = int, default = 20, help = "number of Powerboards printed (default: 20)")
+    parser.add_argument("--min-fraction", type = float, default = 0.5, help = "leave out variables measured for less than this fraction of the Powerboards (default: 0.5)")
+    parser.add_argument("--support", type = float, default = 0.75, help = "fraction of the Powerboards the robust covariance is computed from (default: 0.75)")
+    parser.add_argument("--pairs", type = int, default = 10, help = "number of most strongly correlated pairs of variables printed (default: 10)")
+    parser.add_argument("--output-dir", default = None, help = "directory the correlation matrix plot is saved to (default: no plot)")
+    parser.add_argument("--format", dest = "formats", action = "append", choices = formats, help = "file format of the plot, can be given several times (default: png)")
+    parser.add_argument("--table-dir", default = None, help = "directory the scores of all Powerboards are saved to as a table of .npy columns")
+    args = parser.parse_args(argv)
+
+    stage = prod_plot.stages.get(args.stage, args.stage)
+    scores, names, corr, limit = board_scores(load_table(args.values_dir), stage = stage, min_fraction = args.min_fraction, support = args.support)
+    if scores is None:
+        print("No values found.")
+        return
+
+    print(f"{len(scores['code'])} Powerboards, {len(names)} variables, {int(scores['flagged'].sum())} flagged (squared distance above {limit:.1f})")
+    if len(scores["code"]) < 10 * len(names):
+        print("note: fewer than ten Powerboards per variable, so too many Powerboards may be flagged. the ranking is still meaningful")
+    print(f"\n{'rank':>4} {'serial number':>15} {'distance':>9} {'flagged':>7} {'outlying':>8}  largest robust z-score")
+    for rank in range(min(args.top, len(scores["code"]))):
+        serial_number = scores["serialNumber"][rank] or scores["code"][rank]
+        print(f"{rank + 1:4d} {serial_number:>15} {scores['distance'][rank]:9.1f} {'yes' if scores['flagged'][rank] else 'no':>7} {scores['outlying'][rank]:8d}  {scores['worst_variable'][rank]} ({scores['worst_z'][rank]:+.1f})")
+
+    if args.pairs > 0 and len(names) > 1:
+        print("\nmost strongly correlated variables:")
+        for r, name1, name2 in strongest_pairs(corr, names, args.pairs):
+            print(f"{r:+.2f}  {name1} / {name2}")
+
+    if args.output_dir is not None:
+        os.makedirs(args.output_dir, exist_ok = True)
+        title = f"Correlation of QC variables, {stage}" if stage is not None else "Correlation of QC variables"
+        tasks = [(os.path.join(args.output_dir, f"correlation.{file_format}"), draw_correlation, (corr, names, title)) for file_format in args.formats or ["png"]]
+        render_plots(tasks)
+        print(f"\n{len(tasks)} plots saved to {args.output_dir}")
+    if args.table_dir is not None:
+        save_table(args.table_dir, scores)
+        print(f"\nscores of {len(scores['code'])} Powerboards saved to {args.table_dir}")
+
+if __name__ == "__main__":
+    main()
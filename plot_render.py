@@ -0,0 +1,147 @@
+import concurrent.futures
+import numpy as np
+import matplotlib.dates as mdates
+from matplotlib.figure import Figure
+from running_stats import RunningStats
+
+# headless rendering of histograms and trend plots to PNG, PDF or SVG files. the figures are drawn with matplotlib's object oriented interface on a "Figure" that is not attached to any window, so no display is needed, and the file format is chosen by the extension of the file name
+
+# every process draws all of its plots on the same figure and axes, which are cleared between plots instead of being created again. "render_plots" spreads the plots over a pool of processes, one plot per task
+
+formats = ["png", "pdf", "svg"]
+
+# figure and axes of the current process, created by the first plot it draws. axes added to the figure by a plot, e.g. a second y axis, are removed before the next plot
+
+figure = None
+axes = None
+
+def get_axes():
+    global figure, axes
+    if figure is None:
+        figure = Figure()
+        axes = figure.add_subplot()
+    for other_axes in figure.axes:
+        if other_axes is not axes:
+            other_axes.remove()
+    axes.clear()
+    return axes
+
+# draw a histogram of the values of a variable on a matplotlib axes, displaying the median, standard deviation, threshold values, and the number of measurements falling outside those thresholds (not displayed if outofbounds_ct is None). the values can be a list or a "RunningStats"
+
+def draw_hist(axis, vals, binnum, title, xlabel, threshold, outofbounds_ct, threshold_dir = None, val_name = None):
+    stats = vals if isinstance(vals, RunningStats) else RunningStats.from_values(vals)
+
+    med = stats.median()
+    med_sci = '{:.2e}'.format(med)
+
+    stdev = stats.std()
+    stdev_sci = '{:.2e}'.format(stdev)
+
+    if isinstance(threshold, list):
+        plt_range = (threshold[0], threshold[1])
+    elif val_name == "PADID" or val_name == "RELIABILITY" or threshold is None:
+        plt_range = (stats.min, stats.max)
+    elif threshold_dir == "less":
+        plt_range = (stats.min, threshold)
+    elif threshold_dir == "more":
+        plt_range = (threshold, stats.max)
+
+    counts, edges = stats.histogram(binnum, plt_range)
+    axis.hist(edges[:-1], bins = edges, weights = counts, color = 'steelblue')
+    axis.set_title(title)
+    axis.set_xlabel(xlabel)
+    axis.set_ylabel("Frequency")
+
+    x_min, x_max = axis.get_xlim()
+    y_min, y_max = axis.get_ylim()
+
+    x = x_min + 0.1 * (x_max - x_min)
+    y_1 = y_min + 0.9 * (y_max - y_min)
+    y_2 = y_min + 0.85 * (y_max - y_min)
+    y_3 = y_min + 0.80 * (y_max - y_min)
+    y_4 = y_min + 0.75 * (y_max - y_min)
+
+    axis.text(x, y_1, f"Med = {med_sci}", fontsize = 10, backgroundcolor = 'white')
+    axis.text(x, y_2, rf"$\sigma$ = {stdev_sci}", fontsize = 10, backgroundcolor = 'white')
+
+    if isinstance(threshold, list):
+        axis.text(x, y_3, f"Threshold = {threshold[0]} to {threshold[1]}", fontsize = 10, backgroundcolor = 'white')
+        axis.axvline(x = threshold[0], linestyle = '--', color = 'gray')
+        axis.axvline(x = threshold[1], linestyle = '--', color = 'gray')
+    elif threshold is None:
+        pass
+    else:
+        axis.text(x, y_3, f"Threshold = {threshold}", fontsize = 10, backgroundcolor = 'white')
+        axis.axvline(x = threshold, linestyle = '--', color = 'gray')
+    if outofbounds_ct is not None:
+        axis.text(x, y_4, f"# Outside Threshold = {outofbounds_ct}", fontsize = 10, backgroundcolor = 'white')
+
+# draw the histograms of the values of a variable at several stages on top of each other, as outlines over the same bins, with the number of values, median and standard deviation of each stage in the legend. "stage_stats" is a list of (label, values) pairs, where the values can be a list or a "RunningStats"
+
+def draw_overlay(axis, stage_stats, binnum, title, xlabel, threshold):
+    stage_stats = [(label, vals if isinstance(vals, RunningStats) else RunningStats.from_values(vals)) for label, vals in stage_stats]
+    if isinstance(threshold, list):
+        plt_range = (threshold[0], threshold[1])
+    else:
+        plt_range = (min(stats.min for label, stats in stage_stats), max(stats.max for label, stats in stage_stats))
+
+    for label, stats in stage_stats:
+        counts, edges = stats.histogram(binnum, plt_range)
+        axis.hist(edges[:-1], bins = edges, weights = counts, histtype = 'step', linewidth = 1.5, label = f"{label}: {len(stats)} values, Med = {stats.median():.2e}, " + rf"$\sigma$ = {stats.std():.2e}")
+    thresholds = threshold if isinstance(threshold, list) else [threshold] if threshold is not None else []
+    for value in thresholds:
+        axis.axvline(x = value, linestyle = '--', color = 'gray')
+    axis.set_title(title)
+    axis.set_xlabel(xlabel)
+    axis.set_ylabel("Frequency")
+    axis.legend(loc = 'upper left', fontsize = 8)
+
+# draw the trend of a variable over time on a matplotlib axes: the median of every time window with a band of one standard deviation around it, the threshold values, and the fraction of values outside of the threshold on a second y axis. "trend" is a dictionary of arrays as returned by "trends.trend"
+
+def draw_trend(axis, trend, title, ylabel, threshold):
+    times = np.asarray(trend["end"], dtype = "datetime64[s]")
+    has_values = np.asarray(trend["count"]) > 0
+    median = np.where(has_values, trend["median"], np.nan)
+    sigma = np.where(has_values, trend["sigma"], np.nan)
+
+    axis.fill_between(times, median - sigma, median + sigma, color = 'steelblue', alpha = 0.3, linewidth = 0, label = r"$\pm\sigma$")
+    axis.plot(times, median, color = 'steelblue', marker = '.', label = "Median")
+    thresholds = threshold if isinstance(threshold, list) else [threshold] if threshold is not None else []
+    for value in thresholds:
+        axis.axhline(y = value, linestyle = '--', color = 'gray')
+    axis.set_title(title)
+    axis.set_xlabel("Test date (end of window)")
+    axis.set_ylabel(ylabel)
+    axis.legend(loc = 'upper left', fontsize = 8)
+
+    rate_axis = axis.twinx()
+    rate_axis.step(times, np.where(has_values, trend["failure_rate"], np.nan) * 100, where = 'pre', color = 'firebrick', alpha = 0.7)
+    rate_axis.set_ylabel("% Outside Threshold", color = 'firebrick')
+    rate_axis.set_ylim(bottom = 0)
+    axis.xaxis.set_major_formatter(mdates.ConciseDateFormatter(axis.xaxis.get_major_locator()))
+
+# draw a correlation matrix as a colour map from -1 to 1, with the names of the variables along both axes
+
+def draw_correlation(axis, corr, names, title):
+    image = axis.imshow(corr, cmap = 'coolwarm', vmin = -1, vmax = 1, aspect = 'auto', interpolation = 'nearest')
+    fontsize = max(2, min(8, 300 / max(len(names), 1)))
+    axis.set_xticks(range(len(names)), names, rotation = 90, fontsize = fontsize)
+    axis.set_yticks(range(len(names)), names, fontsize = fontsize)
+    axis.set_title(title)
+    axis.figure.colorbar(image, cax = axis.inset_axes([1.02, 0, 0.03, 1]))
+
+# draw one plot and save it to a file. a task is a (file name, drawing function, arguments of the drawing function after the axes) tuple, so that it can be sent to another process. the drawing function is "draw_hist", "draw_overlay", "draw_trend" or "draw_correlation"
+
+def render_plot(task):
+    filename, draw, args = task
+    draw(get_axes(), *args)
+    figure.savefig(filename)
+    return filename
+
+# render a list of tasks, in this process if workers = 1, otherwise with a pool of "workers" processes. returns the file names in the order of the tasks
+
+def render_plots(tasks, workers = 1):
+    if workers > 1 and len(tasks) > 1:
+        with concurrent.futures.ProcessPoolExecutor(max_workers = min(workers, len(tasks))) as executor:
+            return list(executor.map(render_plot, tasks))
+    return [render_plot(task) for task in tasks]
@@ -1,60 +1,40 @@
-import itkdb
 import argparse
-import requests
-import time
-import http.client
-import datetime
-import json
 import sys
+import os
+import re
+import getpass
+import collections
+import concurrent.futures
 import numpy as np
 import matplotlib.pyplot as plt
+from itk_session import ITkSession
+from testrun_cache import TestRunCache
+from value_store import ValueTable, group_rows, save_table, concat_tables
+from running_stats import RunningStats
+from thresholds import threshold_predicate, outside_mask, state_outside, paired_outside_mask
+from plot_render import formats, draw_hist, draw_overlay, render_plot, render_plots
+from checkpoint import save_checkpoint, load_checkpoint
+from profiling import timers, Profiler, write_report
+from timestamps import run_times
+from slim_runs import SlimRun, slim_runs
 
-# function to convert a formatted date to unix timestamp, this is used to filter warm versus cold tests and pick out the latest date test later in the code. 
- 
-def convert_to_unix(date_time, format_string):
-    dt_object = datetime.datetime.strptime(date_time, format_string)
-    unix_timestamp = int(dt_object.timestamp())
-    return unix_timestamp
+# the script can be run from the command line (see "main" below, or "python prod_plot.py --help"), or imported as a library. importing it has no side effects: nothing is asked for, authenticated or downloaded until one of the functions below is called. a typical use as a library is
 
-# authenticate itkdb and create an instance of the "Client" class from the itkdb module
+#     session = ITkSession(code1, code2)
+#     pwb_serials = {}
+#     testRuns_bycode, request_stats = fetch_test_runs(session, iter_components(session, pwb_serials = pwb_serials), "BURN_IN")
+#     selections = all_selections("BURN_IN")
+#     prod_pwb_vals, count2, outofbounds_ct = extract(testRuns_bycode, selections)
 
-code1 = input("ITk Access Code 1?\n")
-code2 = input("ITk Access Code 2?\n")
+# the same authenticated session can be passed to any number of fetches, e.g. for several stages
 
-user = itkdb.core.User(code1, code2)
-user.authenticate()
+# define a dictionary holding information about each test variable: the name of the test it is measured in, whether it contains an on/off state, whether it differs between warm/cold tests, threshold value, if values should be above or below the threshold (if applicable), and title/xlabel for plot
 
-if user.is_authenticated():
-    print('itkdb login successful!')
-else:
-    print('Login unsuccessful...')
-    sys.exit(1)
-
-print('itkdb authenticate will expire in : '+str(user.expires_in) + ' s')
-
-client=itkdb.Client(user=user)
-
-# create a reauthenticate function to periodically check if expiration is within 5 minutes, and reauthenticate if that is the case
-
-def reauthenticate():
-    global user
-    if user.is_expired() or user.expires_in < 300:
-        print('itkdb login: less than 5 mins left before expires => get new authentication now.')
-        user = itkdb.core.User(code1, code2)
-        user.authenticate()
-        if user.is_authenticated():
-            print('itkdb login successful!')
-        else:
-            print('Login unsuccessful...')
-            sys.exit(1)
-        client=itkdb.Client(user=user)
-
-# define a dictionary holding information about each test variable: whether it contains an on/off state, whether it differs between warm/cold tests, threshold value, if values should be above or below the threshold (if applicable), and title/xlabel for plot
-
-# note: for test value "HVIIN", the threshold value for the "OFF" state depends on the measurement of the "ON" state and vice versa. this is not implemented in this code, and so for this value a plot without thresholds will be produced 
+# note: for test value "HVIIN", the threshold value for the "OFF" state depends on the measurement of the "ON" state and vice versa, so it has no threshold of its own. a "state_threshold" can be set to compare the two states of the same Powerboard instead: the ON value minus the OFF value must then be more than "state_threshold" (see "state_outside" in thresholds.py), and both values fail if it is not. the actual limit is not known yet, so it is None (no threshold)
 
 params = {
     "PADID": {
+        "test_type": "Scan PADID",
         "offon": False,
         "warmcold": False,
         "title": "PADID Scan",
@@ -63,6 +43,7 @@ params = {
         "xlabel": None
     },
     "RELIABILITY": {
+        "test_type": "Bit Error Rate Test",
         "offon": False,
         "warmcold": False,
         "title": "Bit Error Reliability",
@@ -71,6 +52,7 @@ params = {
         "xlabel": None
     },
     "linPOLV": {
+        "test_type": "Low Voltage Enable Test",
         "offon": True,
         "warmcold": False,
         "title": "linPOL Voltage",
@@ -79,6 +61,7 @@ params = {
         "xlabel": "Volts"
     },
     "VOUT": {
+        "test_type": "Low Voltage Enable Test",
         "offon": True,
         "warmcold": False,
         "title": "DC/DC Output Voltage",
@@ -87,14 +70,17 @@ params = {
         "xlabel": "Volts"
     },
     "HVIIN": {
+        "test_type": "High Voltage Enable Test",
         "offon": True,
         "warmcold": False,
         "title": "High Voltage Current In",
         "threshold": None,
         "threshold_dir": None,
+        "state_threshold": None,
         "xlabel": "Amps"
     },
     "HVIOUT": {
+        "test_type": "High Voltage Enable Test",
         "offon": True,
         "warmcold": False,
         "title": "High Voltage Current Out",
@@ -103,6 +89,7 @@ params = {
         "xlabel": "Amps"
     },
     "AMACHVRET": {
+        "test_type": "High Voltage Enable Test",
         "offon": True,
         "warmcold": False,
         "title": "HVret",
@@ -111,6 +98,7 @@ params = {
         "xlabel": "Counts"
     },
     "OFout_value": {
+        "test_type": "Toggle Output",
         "offon": True,
         "warmcold": False,
         "title": "OF Voltage Out",
@@ -119,6 +107,7 @@ params = {
         "xlabel": "Volts"
     },
     "CALx_value": {
+        "test_type": "Toggle Output",
         "offon": True,
         "warmcold": False,
         "title": "CALx Voltage",
@@ -127,6 +116,7 @@ params = {
         "xlabel": "Volts"
     },
     "CALy_value": {
+        "test_type": "Toggle Output",
         "offon": True,
         "warmcold": False,
         "title": "CALy Voltage",
@@ -135,6 +125,7 @@ params = {
         "xlabel": "Volts"
     },
     "Shuntx_value": {
+        "test_type": "Toggle Output",
         "offon": True,
         "warmcold": False,
         "title": "Shuntx Voltage",
@@ -143,6 +134,7 @@ params = {
         "xlabel": "Volts"
     },
     "Shunty_value": {
+        "test_type": "Toggle Output",
         "offon": True,
         "warmcold": False,
         "title": "Shunty Voltage",
@@ -151,6 +143,7 @@ params = {
         "xlabel": "Volts"
     },
     "LDx0EN_value": {
+        "test_type": "Toggle Output",
         "offon": True,
         "warmcold": False,
         "title": "LDx0EN Voltage",
@@ -159,6 +152,7 @@ params = {
         "xlabel": "Volts"
     },
     "LDx1EN_value": {
+        "test_type": "Toggle Output",
         "offon": True,
         "warmcold": False,
         "title": "LDx1EN Voltage",
@@ -167,6 +161,7 @@ params = {
         "xlabel": "Volts"
     },
     "LDx2EN_value": {
+        "test_type": "Toggle Output",
         "offon": True,
         "warmcold": False,
         "title": "LDx2EN Voltage",
@@ -175,6 +170,7 @@ params = {
         "xlabel": "Volts"
     },
     "LDy0EN_value": {
+        "test_type": "Toggle Output",
         "offon": True,
         "warmcold": False,
         "title": "LDy0EN Voltage",
@@ -183,6 +179,7 @@ params = {
         "xlabel": "Volts"
     },
     "LDy1EN_value": {
+        "test_type": "Toggle Output",
         "offon": True,
         "warmcold": False,
         "title": "LDy1EN Voltage",
@@ -191,6 +188,7 @@ params = {
         "xlabel": "Volts"
     },
     "LDy2EN_value": {
+        "test_type": "Toggle Output",
         "offon": True,
         "warmcold": False,
         "title": "LDy2EN Voltage",
@@ -199,6 +197,7 @@ params = {
         "xlabel": "Volts"
     },
     "AMACNTCX": {
+        "test_type": "Temperatures",
         "offon": False,
         "warmcold": True,
         "title": "NTCx",
@@ -207,6 +206,7 @@ params = {
         "xlabel": "Counts" 
     },
     "AMACNTCY": {
+        "test_type": "Temperatures",
         "offon": False,
         "warmcold": True,
         "title": "NTCy",
@@ -215,6 +215,7 @@ params = {
         "xlabel": "Counts" 
     },
     "AMACNTCPB": {
+        "test_type": "Temperatures",
         "offon": False,
         "warmcold": True,
         "title": "NTCpb",
@@ -223,6 +224,7 @@ params = {
         "xlabel": "Counts"
     },
     "AMACCTAT": {
+        "test_type": "Temperatures",
         "offon": False,
         "warmcold": True,
         "title": "CTAT",
@@ -231,6 +233,7 @@ params = {
         "xlabel": "Counts" 
     },
     "AMACPTAT": {
+        "test_type": "Temperatures",
         "offon": False,
         "warmcold": True,
         "title": "PTAT",
@@ -239,6 +242,7 @@ params = {
         "xlabel": "Counts"
     },
     "-6% DC/DC Adjust": {
+        "test_type": "DC/DC Adjust",
         "offon": False,
         "warmcold": False,
         "title": "-6% DC/DC Adjust",
@@ -247,6 +251,7 @@ params = {
         "xlabel": "Percent"
     },
     "-13% DC/DC Adjust": {
+        "test_type": "DC/DC Adjust",
         "offon": False,
         "warmcold": False,
         "title": "-13% DC/DC Adjust",
@@ -255,6 +260,7 @@ params = {
         "xlabel": "Percent"
     },
     "+6% DC/DC Adjust": {
+        "test_type": "DC/DC Adjust",
         "offon": False,
         "warmcold": False,
         "title": "+6% DC/DC Adjust",
@@ -263,6 +269,7 @@ params = {
         "xlabel": "Percent"
     },
     "EFFICIENCY": {
+        "test_type": "DC/DC Efficiency",
         "offon": False,
         "warmcold": False,
         "title": "DC/DC Efficiency",
@@ -273,373 +280,1198 @@ params = {
 
 }
 
-# ask the user for test variable of interest, specificying stage, test temperature, and test name beforehand.  
-
-# testing stages are, for example: Die Attachment and Bonding, Thermal Cycling, Burn-In
-# if "Thermal Cycling" is chosen, temperature is not asked for, as only a warm test is run during this stage
-# for any other stage input, use is prompted to specify either "Warm" or "Cold" to access values within the corresponding tests
-# test names are, for example: "Scan PADID", "High Voltage Enable Test", "Toggle Output", "DC/DC Efficiency", etc
-# test value names are, for example: "HVIOUT", "LDx2EN_value", "AMACPTAT", etc
-# if the chosen test value has an ON/OFF state, the user will be prompted to specify which state
-# based on the test variable chosen, choose ON/OFF state, and set title, x-axis, and threshold
-
-stage_name = input("Testing Stage?\n")
-if stage_name == "Die Attachment and Bonding":
-    stage = "BONDED"
-elif stage_name == "Thermal Cycling":
-    stage = "THERMAL"
-elif stage_name == "Burn-In":
-    stage = "BURN_IN"
-else:
-    print("\nPlease choose a valid testing stage.")
-    sys.exit()
-
-if stage != "THERMAL":
-    temp = input("Warm/Cold?\n")
-
-test_type = input("Test Name?\n")
-    
-if test_type != "DC/DC Adjust" and test_type != "DC/DC Efficiency" and test_type != "Scan PADID" and test_type != "Bit Error Rate Test":
-    val_name = input("Test Value Name?\n")
-    if params[f"{val_name}"]["offon"] == True:
-        state = input("OFF/ON?\n")
-elif test_type == "DC/DC Adjust":
-    percent = input("DC/DC Adjust Percentage?\n")
-    if percent == "-13%":
-        val_name = "-13% DC/DC Adjust"
-    elif percent == "-6%":
-        val_name = "-6% DC/DC Adjust"
-    elif percent == "+6%":
-        val_name = "+6% DC/DC Adjust"
-    else:
-        print("Please input either '-13%', '-6%', or '+6%'.")
-        sys.exit()
-elif test_type == "DC/DC Efficiency":
-    val_name = "EFFICIENCY"
-elif test_type == "Scan PADID":
-    val_name = "PADID"
-elif test_type == "Bit Error Rate Test":
-    val_name = "RELIABILITY"
-
-val_params = params[f"{val_name}"]
-
-if val_params["offon"] == True:
-    if state == "OFF":
-        if val_params["threshold"] is not None:
-            threshold = val_params["threshold"][0]
-            if val_params["threshold_dir"][0] is not None:
-                threshold_dir = val_params["threshold_dir"][0]
-        else:
-            threshold = None
-        title = f"{val_params['title']}, OFF"
-        xlabel = val_params["xlabel"]
-    elif state == "ON":
-        if val_params["threshold"] is not None:
-            threshold = val_params["threshold"][1]
-            if val_params["threshold_dir"][1] is not None:
-                threshold_dir = val_params["threshold_dir"][1]
-        else:
-            threshold = None
-        title = f"{val_params['title']}, ON"
-        xlabel = val_params["xlabel"]
-else:
-    if val_params["warmcold"] == True:
-        if temp == "Warm":
-            threshold = val_params["threshold"][0]
-            title = val_params["title"]
-            xlabel = val_params["xlabel"]
-        elif temp == "Cold":
-            threshold = val_params["threshold"][1]
-            title = val_params["title"]
-            xlabel = val_params["xlabel"]
-    else:
-        threshold = val_params["threshold"]
-        threshold_dir = val_params["threshold_dir"]
-        title = val_params["title"]
-        xlabel = val_params["xlabel"]
 
-# function to plot a list of values in a histogram, displaying the mean, standard deviation, threshold values, and the number of measurements falling outside those thresholds
+# testing stages are, for example: Die Attachment and Bonding, Thermal Cycling, Burn-In. only a warm test is run during "Thermal Cycling", so no temperature is chosen for this stage
 
-def hist_plot(vals, binnum, title, xlabel, threshold, outofbounds_ct):
-    med = np.median(vals)
-    med_sci = '{:.2e}'.format(med)
+stages = {
+    "Die Attachment and Bonding": "BONDED",
+    "Thermal Cycling": "THERMAL",
+    "Burn-In": "BURN_IN"
+}
 
-    stdev = np.std(vals)
-    stdev_sci = '{:.2e}'.format(stdev)
+# function returning the params key of a test variable. besides the keys themselves, the names of tests with a single variable ("Scan PADID", "Bit Error Rate Test", "DC/DC Efficiency") and the DC/DC Adjust percentages ("-13%", "-6%", "+6%") are accepted. returns None for an unknown name
 
-    if isinstance(threshold, list):
-        plt_range = (threshold[0], threshold[1])
-    elif val_name == "PADID" or val_name == "RELIABILITY" or threshold is None:
-        plt_range = (min(vals), max(vals))
-    elif threshold_dir == "less":
-        plt_range = (min(vals), threshold)
-    elif threshold_dir == "more":
-        plt_range = (threshold, max(vals))
-
-    plt.hist(vals, bins = binnum, range = plt_range,  color = 'steelblue')   
-    plt.title(title)
-    plt.xlabel(xlabel)
-    plt.ylabel("Frequency")
-
-    axis = plt.gca()
-    x_min, x_max = axis.get_xlim()
-    y_min, y_max = axis.get_ylim()
-
-    x = x_min + 0.1 * (x_max - x_min)
-    y_1 = y_min + 0.9 * (y_max - y_min)
-    y_2 = y_min + 0.85 * (y_max - y_min)
-    y_3 = y_min + 0.80 * (y_max - y_min)
-    y_4 = y_min + 0.75 * (y_max - y_min)
-
-    plt.text(x, y_1, f"Med = {med_sci}", fontsize = 10, backgroundcolor = 'white')
-    plt.text(x, y_2, rf"$\sigma$ = {stdev_sci}", fontsize = 10, backgroundcolor = 'white')
+def resolve_variable(name):
+    if name in params:
+        return name
+    if f"{name} DC/DC Adjust" in params:
+        return f"{name} DC/DC Adjust"
+    matches = [val_name for val_name, val_params in params.items() if val_params["test_type"] == name]
+    if len(matches) == 1:
+        return matches[0]
+    return None
 
-    if isinstance(threshold, list):
-        plt.text(x, y_3, f"Threshold = {threshold[0]} to {threshold[1]}", fontsize = 10, backgroundcolor = 'white')
-        plt.axvline(x = threshold[0], linestyle = '--', color = 'gray')
-        plt.axvline(x = threshold[1], linestyle = '--', color = 'gray')
-    elif threshold is None:
-        pass
-    else:
-        plt.text(x, y_3, f"Threshold = {threshold}", fontsize = 10, backgroundcolor = 'white')
-        plt.axvline(x = threshold, linestyle = '--', color = 'gray')
-    plt.text(x, y_4, f"# Outside Threshold = {outofbounds_ct}", fontsize = 10, backgroundcolor = 'white')
+# each selected variable is described by a tuple of (value name, OFF/ON state, Warm/Cold temperature, test name). state is None for variables without an ON/OFF state, and temperature is None for "Thermal Cycling"
 
-    plt.show()
+# function returning every variable in "params": every OFF/ON state, every DC/DC Adjust percentage, and, for stages other than "Thermal Cycling", both the warm and the cold tests
 
-# use "get()" method from the "Client" class to receive a list of production Powerboard components
+def all_selections(stage):
+    temps = [None] if stage == "THERMAL" else ["Warm", "Cold"]
+    selections = []
+    for temp in temps:
+        for val_name, val_params in params.items():
+            states = ["OFF", "ON"] if val_params["offon"] else [None]
+            for state in states:
+                selections.append((val_name, state, temp, val_params["test_type"]))
+    return selections
 
-prod_pwb_vals = []
+# function returning the threshold, threshold direction, title and x-axis label of a variable, based on its ON/OFF state and Warm/Cold temperature. "Thermal Cycling" only runs warm tests, so the warm threshold is used when no temperature is given
 
-max_retries = 5 
-retry_delay = 5
+def variable_settings(val_name, state, temp):
+    val_params = params[f"{val_name}"]
+    threshold = val_params["threshold"]
+    threshold_dir = val_params["threshold_dir"]
+    title = val_params["title"]
+    if val_params["offon"] == True:
+        index = 0 if state == "OFF" else 1
+        if threshold is not None:
+            threshold = threshold[index]
+            threshold_dir = threshold_dir[index]
+        title = f"{title}, {state}"
+    elif val_params["warmcold"] == True:
+        threshold = threshold[1] if temp == "Cold" else threshold[0]
+        threshold_dir = None
+    return threshold, threshold_dir, title, val_params["xlabel"]
 
-data = {"componentType": ["PWB"], "subproject": ["SB"], "type":["B3"], "pageInfo": {"pageSize": 32}}
-reauthenticate()
-for attempt in range(1, max_retries + 1):
-    try:
-        prod_pwbs = client.get("listComponents", json = data)
-        break
-    except (requests.exceptions.ConnectionError, http.client.RemoteDisconnected) as e:
-        print(f"Attempt {attempt}: Connection aborted or remote end closed the connection without response.")
-        if attempt < max_retries:
-            print(f"Retrying in {retry_delay} seconds...")
-            time.sleep(retry_delay)
-
-count1 = 0
-count2 = 0
-outofbounds_ct = 0
-
-# save the id codes of production Powerboards to a list
-
-list_pwb_code = []
-for attempt in range(1, max_retries + 1):
-    try:
-        for pwb in prod_pwbs:
+# use "get()" method from the "Client" class to receive the list of production Powerboard components one page of page_size components at a time, and yield the id codes of production Powerboards as soon as each page arrives. the component type, subproject and type are filtered by the database, and the serial number of each component is checked here. if a "pwb_serials" dictionary is given, the serial number of every yielded component is saved in it, keyed by its id code
+
+# each page is requested explicitly by its index, so after a connection error only the failed page is requested again by "ITkSession.get", and the components of earlier pages are not yielded twice
+
+def iter_components(session, page_size = 100, pwb_serials = None):
+    data = {"componentType": ["PWB"], "subproject": ["SB"], "type":["B3"]}
+    page_index = 0
+    received = 0
+    while True:
+        with timers.phase("list components"):
+            page = session.get("listComponents", all_pages = False, json = dict(data, pageInfo = {"pageIndex": page_index, "pageSize": page_size}))
+        items = list(page.data) if hasattr(page, "data") else list(page)
+
+        for pwb in items:
             if pwb['serialNumber'] is not None and '20USBP05' in pwb['serialNumber']:
-                list_pwb_code.append(pwb['code'])
-        break
-    except (requests.exceptions.ConnectionError, http.client.RemoteDisconnected) as e:
-        print(f"Attempt {attempt}: Connection aborted or remote end closed the connection without response.")
-        if attempt < max_retries:
-            print(f"Retrying in {retry_delay} seconds...")
-            time.sleep(retry_delay)
-
-# return a paged object of test run information associated with the component id code
-
-for pwb_code in list_pwb_code:
-    count1 += 1
-    reauthenticate()
-    for attempt in range(1, max_retries + 1):
-        try:
-            testRuns_bycode = client.get("listTestRunsByComponent", json = {"component": pwb_code, "stage": stage})
-            break
-        except (requests.exceptions.ConnectionError, http.client.RemoteDisconnected) as e:
-            print(f"Attempt {attempt}: Connection aborted or remote end closed the connection without response.")
-            if attempt < max_retries:
-                print(f"Retrying in {retry_delay} seconds...")
-                time.sleep(retry_delay)
-
-# optional print statement to help keep track of progress while the code is running. for each loop through the list of pwb codes, print the code
-
-    print("\n", pwb_code)
-    
-# using the test id within each paged object, receive a list of all test runs associated with the component as "testRuns". this is in the JSON data format (dictionary)
-
-    testRuns = []
-    for testRun in testRuns_bycode:
-        reauthenticate()
-        for attempt in range(1, max_retries + 1):
+                if pwb_serials is not None:
+                    pwb_serials[pwb['code']] = pwb['serialNumber']
+                yield pwb['code']
+
+# the last page reached the total number of components reported by the database. the database may return fewer components per page than page_size, so the number of components received so far is compared with the total. if the total is unknown, the last page is the first one shorter than page_size
+
+        page_index += 1
+        received += len(items)
+        total = getattr(page, "total", -1)
+        if total is not None and total >= 0:
+            if received >= total or len(items) == 0:
+                return
+        elif len(items) < page_size:
+            return
+
+# function returning a dictionary of the serial numbers of all production Powerboards, keyed by their id codes
+
+def list_components(session, page_size = 100):
+    pwb_serials = {}
+    for pwb_code in iter_components(session, page_size, pwb_serials):
+        pass
+    return pwb_serials
+
+# function returning the ids and "stateTs" timestamps of all test runs associated with a component id code, in the order they are listed by "listTestRunsByComponent"
+
+def list_run_ids(session, pwb_code, stage):
+    with timers.phase("list test runs"):
+        testRuns_bycode = session.get("listTestRunsByComponent", json = {"component": pwb_code, "stage": stage})
+    return [(testRun['id'], testRun.get('stateTs')) for testRun in testRuns_bycode]
+
+# function returning the full test runs for a chunk of test run ids with a single "getTestRunBulk" call
+
+def fetch_run_chunk(session, chunk):
+    with timers.phase("fetch test runs"):
+        return session.get('getTestRunBulk', json = {'testRun': chunk})
+
+# function applying a download function to every item, either serially or with "workers" concurrent threads. results are always returned in the order of the items, so the results do not depend on the number of workers
+
+def fetch_all(fetch, items, workers = 1):
+    return list(iter_all(fetch, items, workers))
+
+# the same as "fetch_all", but yielding every result as soon as it and all results before it have been received, so each can be processed and released before the following ones arrive. at most two results per worker are downloaded ahead of the result last yielded
+
+def iter_all(fetch, items, workers = 1):
+    if workers <= 1:
+        for item in items:
+            yield fetch(item)
+        return
+    with concurrent.futures.ThreadPoolExecutor(max_workers = workers) as executor:
+        pending = collections.deque()
+        for item in items:
+            pending.append(executor.submit(fetch, item))
+            if len(pending) >= 2 * workers:
+                yield pending.popleft().result()
+        while len(pending) > 0:
+            yield pending.popleft().result()
+
+# function receiving the full test runs of all components at one or more stages with as few "getTestRunBulk" calls as possible. the component id codes can be given as any iterable, e.g. "iter_components", so that test runs are listed while later pages of components are still being received. the test runs of every component are listed once per stage, and the test runs of all stages are then downloaded together. if a cache is given, test runs already cached with the same "stateTs" are read from the cache and only the remaining ones are downloaded. the test run ids to download are gathered into chunks of chunk_size, and each returned test run is mapped back to its component and stage through its id
+
+# returns "testRuns_bystage", holding for every stage and component a list of test runs in the same order as they were listed for that component, and the number of test run requests made per endpoint ("requests"), on behalf of each component ("per_board"), and the number that one "getTestRunBulk" call per test run would have needed ("unbatched")
+
+# if a "failures" dictionary is given, a component whose test runs could not be received at any of the stages is left out of "testRuns_bystage" at every stage and the error is saved in "failures" under its id code, instead of stopping the whole download. a failed "getTestRunBulk" chunk fails every component with a test run in it
+
+# if "listings" is given, e.g. by a poll that already listed the test runs of every component, it holds lists of (test run id, "stateTs") keyed by (id code, stage), and these components are not listed again
+
+# if "project" is given, e.g. from "run_projection", every chunk of test runs is passed through it as soon as it is received (and cached), and the projected test runs are returned, so the full JSON of the test runs is not kept while the rest of the batch is downloaded
+
+def fetch_stage_test_runs(session, pwb_codes, stage_list, chunk_size = 100, workers = 1, cache = None, failures = None, project = None, listings = None):
+    request_ct = {"listTestRunsByComponent": 0, "getTestRunBulk": 0}
+    board_request_ct = {}
+    list_pwb_code = []
+    failed = {}
+
+    def listed(pwb_codes):
+        for pwb_code in pwb_codes:
+            list_pwb_code.append(pwb_code)
+            for stage in stage_list:
+                yield pwb_code, stage
+
+    def guarded(fetch):
+        if failures is None:
+            return fetch
+        def fetch_or_error(item):
             try:
-                result = client.get('getTestRunBulk', json = {'testRun':[testRun['id']]})
-                break
-            except (requests.exceptions.ConnectionError, http.client.RemoteDisconnected) as e:
-                print(f"Attempt {attempt}: Connection aborted or remote end closed the connection without response.")
-                if attempt < max_retries:
-                    print(f"Retrying in {retry_delay} seconds...")
-                    time.sleep(retry_delay)
-        testRuns.append(result[0])
+                return fetch(item)
+            except Exception as e:
+                return e
+        return fetch_or_error
+
+    known = listings if listings is not None else {}
+    listed_runs = fetch_all(guarded(lambda item: known[item] if item in known else list_run_ids(session, item[0], item[1])), listed(pwb_codes), workers)
+    run_ids_bykey = {}
+    for (pwb_code, stage), run_ids in zip([(pwb_code, stage) for pwb_code in list_pwb_code for stage in stage_list], listed_runs):
+        if isinstance(run_ids, Exception):
+            failed[pwb_code] = run_ids
+            run_ids = []
+        run_ids_bykey[(pwb_code, stage)] = run_ids
+    request_ct["listTestRunsByComponent"] += sum(1 for key in run_ids_bykey if key not in known)
+    for pwb_code in list_pwb_code:
+        board_request_ct[pwb_code] = sum(1 for stage in stage_list if (pwb_code, stage) not in known)
+
+# a test run listed more than once, e.g. at two stages, is downloaded once and added to each of its listings
+
+    testRuns_bykey = {key: [] for key in run_ids_bykey}
+    run_owners = {}
+    run_order = {}
+    all_run_ids = []
+    fetch_run_ids = []
+    cached_runs = {}
+    unprojected = []
+
+# cached test runs are projected in groups of chunk_size as they are read, so the full JSON of at most one group is held at a time
+
+    def project_cached():
+        cached_runs.update(zip([run_id for run_id, testRun in unprojected], project_runs(project, [testRun for run_id, testRun in unprojected])))
+        unprojected.clear()
+
+    for key, run_ids in run_ids_bykey.items():
+        for index, (run_id, state_ts) in enumerate(run_ids):
+            run_order[(key, run_id)] = index
+            all_run_ids.append(run_id)
+            if run_id in run_owners:
+                run_owners[run_id].append(key)
+                continue
+            run_owners[run_id] = [key]
+            cached_run = None
+            if cache is not None:
+                with timers.phase("test run cache"):
+                    cached_run = cache.get(run_id, state_ts)
+            if cached_run is not None:
+                unprojected.append((run_id, cached_run))
+                if len(unprojected) == chunk_size:
+                    project_cached()
+            else:
+                fetch_run_ids.append(run_id)
+    project_cached()
+    for run_id, testRun in cached_runs.items():
+        for key in run_owners[run_id]:
+            testRuns_bykey[key].append((run_id, testRun))
 
+    chunks = [fetch_run_ids[start:start + chunk_size] for start in range(0, len(fetch_run_ids), chunk_size)]
 
-    if len(testRuns) == 0:
+    for chunk, result in zip(chunks, iter_all(guarded(lambda chunk: fetch_run_chunk(session, chunk)), chunks, workers)):
+        request_ct["getTestRunBulk"] += 1
+        for pwb_code in set(key[0] for run_id in chunk for key in run_owners[run_id]):
+            board_request_ct[pwb_code] += 1
+            if isinstance(result, Exception):
+                failed[pwb_code] = result
+        if isinstance(result, Exception):
             continue
+        if cache is not None:
+            with timers.phase("test run cache"):
+                cache.put_many(result)
+        for run_id, testRun in zip([testRun['id'] for testRun in result], project_runs(project, result)):
+            for key in run_owners[run_id]:
+                testRuns_bykey[key].append((run_id, testRun))
 
-# filter testRuns by warm/cold. first, find the CTAToffset value within each "Temperatures" test (4 for warm, 9 for cold). find the upload timestamp(s) for the correct CTAToffset value with "stateTs", and find all tests uploaded within 10 minutes of that value. 
+    testRuns_bystage = {stage: {} for stage in stage_list}
+    for (pwb_code, stage), testRuns in testRuns_bykey.items():
+        testRuns.sort(key = lambda item: run_order[((pwb_code, stage), item[0])])
+        if pwb_code not in failed:
+            testRuns_bystage[stage][pwb_code] = [testRun for run_id, testRun in testRuns]
 
-    if stage != "THERMAL":
-        testRuns_therm = []
-        if temp == "Warm":
-            testRuns_temp_list = []
-            i = 0
-            while i < len(testRuns):
-                if testRuns[i]['testType']['name'] == "Temperatures":
-                    testRuns_temp_list.append(testRuns[i])
-                i += 1
-            testRuns_temp_warm = []
-            i = 0
-            while i < len(testRuns_temp_list):
-                if testRuns_temp_list[i]['results'][2]['value'] == 4:
-                    testRuns_temp_warm.append(testRuns_temp_list[i])
-                i += 1
-            warm_time_list = []
-            i = 0
-            while i < len(testRuns_temp_warm):
-                warm_time_list.append(convert_to_unix(testRuns_temp_warm[i]['stateTs'].replace('T', ' ').replace('Z',''),"%Y-%m-%d %H:%M:%S.%f"))
-                i += 1
-            i = 0
-            while i < len(testRuns):
-                for time in warm_time_list:
-                    if abs(convert_to_unix(testRuns[i]['stateTs'].replace('T', ' ').replace('Z', ''), "%Y-%m-%d %H:%M:%S.%f") - time) < 600:
-                        testRuns_therm.append(testRuns[i])
-                i += 1
-        elif temp == "Cold":
-            testRuns_temp_list = []
-            i = 0
-            while i < len(testRuns):
-                if testRuns[i]['testType']['name'] == "Temperatures":
-                    testRuns_temp_list.append(testRuns[i])
-                i += 1
-            testRuns_temp_cold = []
-            i = 0
-            while i < len(testRuns_temp_list):
-                if testRuns_temp_list[i]['results'][2]['value'] == 8:
-                    testRuns_temp_cold.append(testRuns_temp_list[i])
-                i += 1
-            cold_time_list = []
-            i = 0
-            while i < len(testRuns_temp_cold):
-                cold_time_list.append(convert_to_unix(testRuns_temp_cold[i]['stateTs'].replace('T', ' ').replace('Z',''),"%Y-%m-%d %H:%M:%S.%f"))
-                i += 1
-            i = 0
-            while i < len(testRuns):
-                for time in cold_time_list:
-                     if abs(convert_to_unix(testRuns[i]['stateTs'].replace('T', ' ').replace('Z', ''), "%Y-%m-%d %H:%M:%S.%f") - time) < 600:
-
-                        testRuns_therm.append(testRuns[i])
-                i += 1
-    else:
-        testRuns_therm = testRuns
+    for pwb_code, e in failed.items():
+        failures[pwb_code] = f"{type(e).__name__}: {e}"
 
-    if len(testRuns_therm) == 0:
-        continue
+    request_stats = {
+        "requests": request_ct,
+        "per_board": board_request_ct,
+        "unbatched": len(run_ids_bykey) + len(all_run_ids)
+    }
+    return testRuns_bystage, request_stats
 
-# filter the list of tests by the type of test. if there are more than one tests of the same type at this point, take the latest date test
+# pass a list of test runs through a projection. if the projection fails, e.g. for a malformed test run, the test runs it fails for are returned unchanged, so the error is raised when the values of their Powerboard are extracted, and only that Powerboard is skipped
 
-    testRuns_type = []
-    i = 0
-    while i < len(testRuns_therm):
-        if testRuns_therm[i]['testType']['name'] == test_type:
-            testRuns_type.append(testRuns_therm[i])
-        i += 1
+def project_runs(project, testRuns):
+    if project is None or len(testRuns) == 0:
+        return testRuns
+    with timers.phase("projection"):
+        try:
+            return project(testRuns)
+        except extraction_errors:
+            projected = []
+            for testRun in testRuns:
+                try:
+                    projected.extend(project([testRun]))
+                except extraction_errors:
+                    projected.append(testRun)
+            return projected
 
-    if len(testRuns_type) == 0:
-        continue
-    elif len(testRuns_type) == 1:
-        testRuns_type = testRuns_type[0]
-    else:
-        dates = []
-        i = 0
-        while i < len(testRuns_type):
-            dt = testRuns_type[i]['date']
-            dates.append(dt)
-            i += 1
-        formatted_dates = []
-        for date in dates:
-            date_format = date.replace('T', ' ').replace('Z','')
-            formatted_dates.append(date_format)
-        unix_dates = []
-        for date in formatted_dates:
-            unix_dates.append(convert_to_unix(date, "%Y-%m-%d %H:%M:%S.%f"))
-        latest_date = max(unix_dates)
-        latest_index = unix_dates.index(latest_date)
-        testRuns_type = testRuns_type[latest_index]
+# the projection of test runs to compact "SlimRun" records keeping only the results the selected variables are read from, and the CTAToffset of the "Temperatures" tests used to match warm and cold tests, see slim_runs.py
+
+def run_projection(selections):
+    names = {}
+    positions = {"Temperatures": {2}}
+    for extractor in compile_extractors(selections):
+        if extractor.key is not None:
+            names.setdefault(extractor.test_type, set()).add(extractor.key)
+        if extractor.position is not None:
+            positions.setdefault(extractor.test_type, set()).add(extractor.position)
+    return lambda testRuns: slim_runs(testRuns, names, positions)
+
+# function receiving the full test runs of all components at one stage, returning "testRuns_bycode", holding for every component a list of its test runs, and the request statistics, as described for "fetch_stage_test_runs"
+
+def fetch_test_runs(session, pwb_codes, stage, chunk_size = 100, workers = 1, cache = None, failures = None):
+    testRuns_bystage, request_stats = fetch_stage_test_runs(session, pwb_codes, [stage], chunk_size = chunk_size, workers = workers, cache = cache, failures = failures)
+    return testRuns_bystage[stage], request_stats
+
+# filter testRuns by warm/cold. first, find the CTAToffset value within each "Temperatures" test (4 for warm, 8 for cold), and take the upload timestamps ("stateTs") of the tests with the correct CTAToffset value as sorted reference times. every test run is matched to its nearest reference time with a binary search, and is kept if it was uploaded within 10 minutes of it. each test run is returned at most once, in its original order. without a temperature ("Thermal Cycling"), all tests are returned
+
+# the upload timestamps from "run_times" can be passed as "times". the test runs can be given as JSON or as "SlimRun"
+
+def filter_temperature(testRuns, temp, times = None):
+    if temp is None:
+        return testRuns
+    slim = slim_runs(testRuns)
+    if times is None:
+        times = run_times(slim)
+    ctat_offset = {"Warm": 4, "Cold": 8}.get(temp)
+    is_ref = np.array([testRun.test_type == "Temperatures" and testRun.positions[2] == ctat_offset for testRun in slim], dtype = bool)
+    ref_times = np.sort(times[is_ref])
+    if len(ref_times) == 0:
+        return []
+
+    index = np.searchsorted(ref_times, times)
+    before = ref_times[np.clip(index - 1, 0, len(ref_times) - 1)]
+    after = ref_times[np.clip(index, 0, len(ref_times) - 1)]
+    nearest = np.minimum(np.abs(times - before), np.abs(after - times))
+    return [testRun for testRun, keep in zip(testRuns, nearest < 600) if keep]
 
+# filter the list of tests by the type of test. if there are more than one tests of the same type at this point, return the latest date test. if there is none, return None
+
+def latest_run(testRuns, test_type):
+    testRuns_type = [testRun for testRun, slim in zip(testRuns, slim_runs(testRuns)) if slim.test_type == test_type]
     if len(testRuns_type) == 0:
-        continue
-
-# find the value of interest, and decide whether it lies within the threshold or not        
-  
-    if val_name == "-13% DC/DC Adjust" or val_name == "-6% DC/DC Adjust" or val_name == "+6% DC/DC Adjust":
-        val_name = "VOUT"
-
-    val = []
-    i = 0
-    while i < len(testRuns_type['results']):
-        if testRuns_type['results'][i]['name'] == val_name:
-           val.append(testRuns_type['results'][i]['value'])
-           break
-        i += 1
-
-    val = val[0]
-
-    if val_params["offon"] == True: 
-        if state == "OFF":
-            if val_name == "linPOLV":
-                val = val[1]
-            else:
-                val = val[0] 
-        elif state == "ON":
-            if val_name == "linPOLV":
-                val = val[0]
-            else:
-                val = val[1]
-    elif test_type == "DC/DC Efficiency":
-        val = val[10] * 100
-    elif test_type == "DC/DC Adjust":
-        if percent == "-13%":
-            val = (testRuns_type['results'][2]['value'][2] / testRuns_type['results'][2]['value'][0] - 1) * 100
-        elif percent == "-6%":
-            val = (testRuns_type['results'][2]['value'][1] / testRuns_type['results'][2]['value'][0] - 1) * 100
-        elif percent == "+6%":
-            val = (testRuns_type['results'][2]['value'][3] / testRuns_type['results'][2]['value'][0] - 1) * 100
+        return None
+    unix_dates = run_times(testRuns_type, "date").tolist()
+    return testRuns_type[unix_dates.index(max(unix_dates))]
+
+# every selected variable is compiled once into an "Extractor", holding everything needed to find its value in a test run: the name of the test, the name of the result, the position of the OFF/ON state within the result, how the value is derived from the result, and the threshold as a compiled predicate "outside(val)". for variables with a "state_threshold", "check" compares the OFF and ON values of the same test run instead
+
+# values with an OFF/ON state are stored as [OFF, ON], except for "linPOLV" which is stored as [ON, OFF]. the efficiency is stored as a fraction for a range of loads, of which val[10] is plotted in percent. the DC/DC Adjust percentages are computed from the output voltages stored in results[2] of the "DC/DC Adjust" test, relative to the unadjusted voltage
+
+swapped_offon = ["linPOLV"]
+
+adjust_index = {"-13% DC/DC Adjust": 2, "-6% DC/DC Adjust": 1, "+6% DC/DC Adjust": 3}
+
+def efficiency_percent(val):
+    return val[10] * 100
+
+def adjust_ratio(index):
+    def percent(vout):
+        return (vout[index] / vout[0] - 1) * 100
+    return percent
+
+class Extractor:
+    def __init__(self, selection):
+        val_name, state, temp, test_type = selection
+        val_params = params[val_name]
+        self.val_name = val_name
+        self.temp = temp
+        self.test_type = test_type
+        self.key = val_name
+        self.position = None
+        self.index = None
+        self.derive = None
+        if val_name in adjust_index:
+            self.key = None
+            self.position = 2
+            self.derive = adjust_ratio(adjust_index[val_name])
+        elif val_params["offon"] == True:
+            self.index = 1 if state == "ON" else 0
+            if val_name in swapped_offon:
+                self.index = 1 - self.index
+        elif val_name == "EFFICIENCY":
+            self.derive = efficiency_percent
+        self.threshold, self.threshold_dir, self.title, self.xlabel = variable_settings(val_name, state, temp)
+        self.outside = threshold_predicate(self.threshold, self.threshold_dir)
+        self.state_threshold = val_params.get("state_threshold") if self.index is not None else None
+        self.off_index = 1 if val_name in swapped_offon else 0
+
+    # the value in a test run ("SlimRun"), given with its results indexed by "index_results". returns None if the test run has no such value
+
+    def value(self, testRun, results):
+        if self.position is not None:
+            val = testRun.positions[self.position]
         else:
-            pass
-    
-    count2 += 1
+            val = results.get(self.key)
+            if val is None:
+                return None
+            if self.index is not None:
+                val = val[self.index]
+        if self.derive is not None:
+            return self.derive(val)
+        return val
+
+    # decide whether the value found in a test run lies outside of the threshold
+
+    def check(self, testRun, results, val):
+        if self.state_threshold is not None:
+            vals = results[self.key]
+            return bool(state_outside(vals[self.off_index], vals[1 - self.off_index], self.state_threshold))
+        return self.outside(val)
+
+def compile_extractors(selections):
+    return [Extractor(selection) for selection in selections]
+
+# function returning the values of the results of a test run keyed by their names. if several results have the same name, the first one is kept
+
+def index_results(testRun):
+    if isinstance(testRun, SlimRun):
+        return testRun.results
+    results = {}
+    for result in testRun['results']:
+        results.setdefault(result['name'], result['value'])
+    return results
+
+# find the value of interest within a test run. returns None if the test run has no such value
+
+def extract_value(testRun, val_name, state):
+    slim = slim_runs([testRun])[0]
+    return Extractor((val_name, state, None, params[val_name]["test_type"])).value(slim, index_results(slim))
+
+# decide whether a value lies outside of the threshold
+
+def out_of_bounds(val, threshold, threshold_dir):
+    return threshold_predicate(threshold, threshold_dir)(val)
+
+# function checking every value of a table saved with "value_store" against the current thresholds in "params", e.g. after the thresholds were changed, without downloading or extracting anything again. the rows are grouped by stage, temperature, variable and state, and each group is checked at once. the OFF and ON values of variables with a "state_threshold" are joined through their Powerboard id codes, so both states must be in the table for them to be checked
+
+# returns a boolean array, True for every row within the thresholds, and the number of values outside of the thresholds for every rule, keyed by e.g. "BURN_IN Warm HVIIN ON"
+
+def evaluate_thresholds(table):
+    outside = np.zeros(len(table["value"]), dtype = bool)
+    failures = {}
+    paired = {}
+    for (stage, temp, val_name, state), rows in group_rows(table, ["stage", "temp", "variable", "state"]):
+        name = " ".join(part for part in [stage, temp, val_name, state] if part != "")
+        if val_name not in params:
+            continue
+        if params[val_name]["offon"] == True and params[val_name].get("state_threshold") is not None:
+            paired.setdefault((stage, temp, val_name), {})[state] = (name, rows)
+            continue
+        threshold, threshold_dir, title, xlabel = variable_settings(val_name, state or None, temp or None)
+        mask = outside_mask(table["value"][rows], threshold, threshold_dir)
+        outside[rows] = mask
+        failures[name] = int(mask.sum())
+
+    for (stage, temp, val_name), states in paired.items():
+        if "OFF" not in states or "ON" not in states:
+            continue
+        (name_off, rows_off), (name_on, rows_on) = states["OFF"], states["ON"]
+        state_threshold = params[val_name]["state_threshold"]
+        mask_off, mask_on = paired_outside_mask(table["code"][rows_off], table["value"][rows_off], table["code"][rows_on], table["value"][rows_on], lambda val_off, val_on: state_outside(val_off, val_on, state_threshold))
+        outside[rows_off] = mask_off
+        outside[rows_on] = mask_on
+        failures[name_off] = int(mask_off.sum())
+        failures[name_on] = int(mask_on.sum())
+    return ~outside, failures
+
+
+# index of the test runs of one Powerboard at one stage, built once per Powerboard: the runs of each temperature (Warm/Cold, or None for all runs) are grouped by test name, and each group is sorted by test date. the latest run, the first run and all retests of a test are then found by a single lookup. the temperature filter and the sorting are only done for the temperatures and tests asked for. of several runs with the same date, the one listed first counts as the latest, as in "latest_run". test runs given as JSON are converted to "SlimRun", and the runs returned are "SlimRun"
+
+class RunIndex:
+    def __init__(self, testRuns):
+        self.testRuns = slim_runs(testRuns)
+        self.times = None
+        self.by_temp = {}
+        self.sorted_runs = {}
+        self.indexed_results = {}
+
+    # the runs of a test at a temperature, sorted from the first to the latest
+
+    def runs(self, temp, test_type):
+        key = (temp, test_type)
+        if key not in self.sorted_runs:
+            if temp not in self.by_temp:
+                if temp is not None and self.times is None:
+                    self.times = run_times(self.testRuns)
+                groups = {}
+                for position, testRun in enumerate(filter_temperature(self.testRuns, temp, self.times)):
+                    groups.setdefault(testRun.test_type, []).append((position, testRun))
+                self.by_temp[temp] = groups
+            group = self.by_temp[temp].get(test_type, [])
+            dates = run_times([testRun for position, testRun in group], "date").tolist()
+            order = sorted(range(len(group)), key = lambda n: (dates[n], -group[n][0]))
+            self.sorted_runs[key] = [(dates[n], group[n][1]) for n in order]
+        return [testRun for date, testRun in self.sorted_runs[key]]
+
+    def latest(self, temp, test_type):
+        runs = self.runs(temp, test_type)
+        return runs[-1] if len(runs) > 0 else None
+
+    def first(self, temp, test_type):
+        runs = self.runs(temp, test_type)
+        return runs[0] if len(runs) > 0 else None
+
+    # the dates of the runs of a test, in the same order as "runs"
+
+    def dates(self, temp, test_type):
+        self.runs(temp, test_type)
+        return [date for date, testRun in self.sorted_runs[(temp, test_type)]]
+
+    # the results of a test run indexed by name, see "index_results"
+
+    def results(self, testRun):
+        if id(testRun) not in self.indexed_results:
+            self.indexed_results[id(testRun)] = index_results(testRun)
+        return self.indexed_results[id(testRun)]
+
+# function returning the values of the selected variables in the latest runs of one Powerboard, as a list of (selection index, value, test run, outside of the threshold) tuples. the test runs are looked up in a "RunIndex", which can be passed as "index" if it was already built, so the runs are filtered, sorted and their results indexed only once for all variables. the extractors compiled from the selections can be passed as "extractors" so they are only compiled once for all Powerboards
+
+def extract_board(testRuns, selections, extractors = None, index = None):
+    if extractors is None:
+        extractors = compile_extractors(selections)
+    if index is None:
+        index = RunIndex(testRuns)
+    found = []
+    for i, extractor in enumerate(extractors):
+        testRun = index.latest(extractor.temp, extractor.test_type)
+        if testRun is None:
+            continue
+
+        results = index.results(testRun)
+        val = extractor.value(testRun, results)
+        if val is not None:
+            found.append((i, val, testRun, extractor.check(testRun, results, val)))
+    return found
+
+# class holding the test history of every Powerboard of a crawl: the dates and ids of all runs, keyed by (component, stage, temperature, test name) and sorted from the first to the latest run, and, for every selected variable, whether its value passed the threshold in each of these runs. only ids, dates and outcomes are kept, not the test runs themselves. Powerboards are added with "add_board", usually by "Extraction"
+
+# the outcomes give retest statistics for every variable: how many Powerboards were tested more than once, how many failed their first test, and how many of those passed their latest test (recovered) or still failed it, and how many passed their first test but failed their latest (regressed)
+
+# for checkpoints, the histories of the Powerboards added since the last checkpoint ("pending") are written with "flush" to a new JSON segment, so every checkpoint only writes the new Powerboards. the whole history is kept in memory for the statistics
+
+class RetestHistory:
+    def __init__(self, stage, selections):
+        self.stage = stage
+        self.selections = selections
+        self.extractors = compile_extractors(selections)
+        self.runs = {}
+        self.outcomes = [{} for selection in selections]
+        self.pending = []
+        self.segments = []
+        self.segment_boards = 0
+
+    # return the history of one Powerboard without adding it. the outcome of a malformed older run is left out of its history, so it does not cost the Powerboard the values of its latest runs
+
+    def board_history(self, pwb_code, index):
+        runs = {}
+        outcomes = []
+        for i, extractor in enumerate(self.extractors):
+            key = (pwb_code, self.stage, extractor.temp, extractor.test_type)
+            if key not in runs:
+                runs[key] = [(date, testRun.id) for date, testRun in zip(index.dates(extractor.temp, extractor.test_type), index.runs(extractor.temp, extractor.test_type))]
+            passed = []
+            for testRun in index.runs(extractor.temp, extractor.test_type):
+                try:
+                    results = index.results(testRun)
+                    val = extractor.value(testRun, results)
+                    if val is None:
+                        continue
+                    outside = extractor.check(testRun, results, val)
+                except extraction_errors:
+                    continue
+                passed.append(not outside)
+            outcomes.append(passed)
+        return runs, outcomes
+
+    def add(self, pwb_code, history):
+        runs, outcomes = history
+        self.runs.update((key, value) for key, value in runs.items() if len(value) > 0)
+        for i, passed in enumerate(outcomes):
+            if len(passed) > 0:
+                self.outcomes[i][pwb_code] = passed
+        self.pending.append(pwb_code)
+
+    # the (date, id) of the runs of a test of a Powerboard, from the first to the latest, and the latest and first of them (None if there is none)
 
+    def board_runs(self, pwb_code, temp, test_type):
+        return self.runs.get((pwb_code, self.stage, temp, test_type), [])
+
+    def latest(self, pwb_code, temp, test_type):
+        runs = self.board_runs(pwb_code, temp, test_type)
+        return runs[-1] if len(runs) > 0 else None
+
+    def first(self, pwb_code, temp, test_type):
+        runs = self.board_runs(pwb_code, temp, test_type)
+        return runs[0] if len(runs) > 0 else None
+
+    # retest statistics of every selected variable, as a list of dictionaries in the order of the selections
+
+    def retest_stats(self):
+        stats = []
+        for outcomes in self.outcomes:
+            retested = [passed for passed in outcomes.values() if len(passed) > 1]
+            stats.append({
+                "tested": len(outcomes),
+                "retested": len(retested),
+                "runs": sum(len(passed) for passed in outcomes.values()),
+                "first_failed": sum(1 for passed in outcomes.values() if not passed[0]),
+                "recovered": sum(1 for passed in retested if not passed[0] and passed[-1]),
+                "still_failing": sum(1 for passed in retested if not passed[0] and not passed[-1]),
+                "regressed": sum(1 for passed in retested if passed[0] and not passed[-1])
+            })
+        return stats
+
+    # print the retest statistics of every variable with retested Powerboards
+
+    def report(self):
+        for (val_name, state, temp, test_type), stats in zip(self.selections, self.retest_stats()):
+            if stats["retested"] == 0:
+                continue
+            name = " ".join(part for part in [temp, val_name, state] if part is not None)
+            print(f"{name}: {stats['retested']} of {stats['tested']} Powerboards retested ({stats['runs']} runs), {stats['first_failed']} failed their first test, {stats['recovered']} recovered, {stats['still_failing']} still failing, {stats['regressed']} regressed")
+
+    # the history of some Powerboards (all if pwb_codes is None) as a dictionary that can be saved as JSON
+
+    def board_state(self, pwb_codes = None):
+        pwb_codes = set(pwb_codes) if pwb_codes is not None else None
+        return {
+            "runs": [list(key) + [value] for key, value in self.runs.items() if pwb_codes is None or key[0] in pwb_codes],
+            "outcomes": [{pwb_code: passed for pwb_code, passed in outcomes.items() if pwb_codes is None or pwb_code in pwb_codes} for outcomes in self.outcomes]
+        }
+
+    def add_state(self, state):
+        self.runs.update((tuple(entry[:4]), [tuple(run) for run in entry[4]]) for entry in state["runs"])
+        for outcomes, saved in zip(self.outcomes, state["outcomes"]):
+            outcomes.update(saved)
+
+    # write the histories of the Powerboards added since the last flush to a new segment in "directory"
+
+    def flush(self, directory):
+        if len(self.pending) == 0:
+            return
+        segment = f"boards-{self.segment_boards:09d}.json"
+        save_checkpoint(os.path.join(directory, segment), self.board_state(self.pending))
+        self.segments.append(segment)
+        self.segment_boards += len(self.pending)
+        self.pending = []
+
+    # the history as a dictionary that can be saved as JSON, and restored with "restore". with a directory, the new histories are first flushed to a segment in it, and only the names of the segments are returned
+
+    def state(self, directory = None):
+        if directory is None:
+            return self.board_state()
+        self.flush(directory)
+        return {"segments": self.segments, "segment_boards": self.segment_boards}
+
+    def restore(self, state, directory = None):
+        self.runs = {}
+        self.outcomes = [{} for selection in self.selections]
+        self.pending = []
+        if "segments" not in state:
+            self.add_state(state)
+            self.pending = list(dict.fromkeys([key[0] for key in self.runs] + [pwb_code for outcomes in self.outcomes for pwb_code in outcomes]))
+            return
+        for segment in state["segments"]:
+            self.add_state(load_checkpoint(os.path.join(directory, segment)))
+        self.segments = list(state["segments"])
+        self.segment_boards = state["segment_boards"]
+
+# number of histogram bins of every plot
+
+hist_bins = 50
+
+# class collecting, for every selected variable, the values of all Powerboards in "prod_pwb_vals", with the number of Powerboards processed (count1), the number of values collected (count2) and the number of values outside of the threshold (outofbounds_ct). Powerboards are added one at a time with "add_board"
+
+# the values of every variable are also added to a "RunningStats" in "stats", which keeps their median, standard deviation, range and histogram as they arrive. with keep_values = False, "prod_pwb_vals" is left empty and only "stats" is kept, so the memory used does not grow with the number of Powerboards. for variables with a fixed plot range (a threshold range), the histogram is counted exactly over the bins of the plot
+
+# if a "ValueTable" is given, every value is also added to it, together with the Powerboard and test run it came from and whether it lies within the threshold. if a "RetestHistory" is given, the history of every Powerboard is added to it
+
+# with progress = True, the pwb code is printed for each loop through the Powerboards to help keep track of progress. for a single variable, the value of interest is printed as well, with count1, count2 and outofbounds_ct, and the median and standard deviation of the values so far. for several variables, the number of variables found for the Powerboard is printed
+
+class Extraction:
+    def __init__(self, selections, progress = True, table = None, keep_values = True, history = None):
+        self.selections = selections
+        self.history = history
+        self.extractors = compile_extractors(selections)
+        self.progress = progress
+        self.table = table
+        self.keep_values = keep_values
+        self.prod_pwb_vals = [[] for selection in selections]
+        self.stats = [RunningStats(edges = hist_edges(extractor.threshold)) for extractor in self.extractors]
+        self.count1 = 0
+        self.count2 = [0 for selection in selections]
+        self.outofbounds_ct = [0 for selection in selections]
+
+    # add the values of one Powerboard, and return them as "extract_board" does. a malformed test run raises an error before anything is added, so a Powerboard is either added completely or not at all
+
+    def add_board(self, pwb_code, testRuns):
+        board = self.board_values(pwb_code, testRuns)
+        self.add_values(pwb_code, board)
+        return board[0]
+
+    # the values of one Powerboard, extracted without adding them, and added with "add_values"
+
+    def board_values(self, pwb_code, testRuns):
+        index = RunIndex(testRuns)
+        found = extract_board(testRuns, self.selections, self.extractors, index) if len(testRuns) > 0 else []
+        history = self.history.board_history(pwb_code, index) if self.history is not None else None
+        numbers = [float(val) for i, val, testRun, outside in found]
+        dates = []
+        if self.table is not None:
+            dates = run_times([testRun for i, val, testRun, outside in found], "date").tolist()
+        return found, history, numbers, dates
+
+    def add_values(self, pwb_code, board):
+        found, history, numbers, dates = board
+        self.count1 += 1
+        if self.progress:
+            print("\n", pwb_code)
+        if history is not None:
+            self.history.add(pwb_code, history)
+
+        for n, (i, val, testRun, outside) in enumerate(found):
+            self.count2[i] += 1
+            if outside:
+                self.outofbounds_ct[i] += 1
+            self.stats[i].add(numbers[n], passed = not outside)
+            if self.keep_values:
+                self.prod_pwb_vals[i].append(val)
+            if self.table is not None:
+                self.table.append(pwb_code, self.selections[i], val, not outside, testRun.id, dates[n])
+            if self.progress and len(self.selections) == 1:
+                print(val, "\n",  self.count1, self.count2[i], self.outofbounds_ct[i])
+                print(f"median = {self.stats[i].median():.3g}, sigma = {self.stats[i].std():.3g}")
+
+        if self.progress and len(self.selections) > 1:
+            print(len(found), "variables found,", self.count1)
+
+    # the collected values and counts as a dictionary that can be saved as JSON, and restored with "restore". with a directory, e.g. next to a checkpoint, the rows of the "ValueTable" and the "RetestHistory" are written to segments in it, each time only those added since the last call, and only the names of the segments are returned (see "ValueTable.flush"), so the state does not grow with the number of Powerboards
+
+    def state(self, directory = None):
+        state = {
+            "selections": [list(selection) for selection in self.selections],
+            "prod_pwb_vals": self.prod_pwb_vals,
+            "stats": [stats.state() for stats in self.stats],
+            "count1": self.count1,
+            "count2": self.count2,
+            "outofbounds_ct": self.outofbounds_ct
+        }
+        if self.table is not None:
+            state["table"] = self.table.state(os.path.join(directory, "table") if directory is not None else None)
+        if self.history is not None:
+            state["history"] = self.history.state(os.path.join(directory, "history") if directory is not None else None)
+        return state
+
+    def restore(self, state, directory = None):
+        if state["selections"] != [list(selection) for selection in self.selections]:
+            raise ValueError("the saved values were extracted for different variables")
+        self.prod_pwb_vals = state["prod_pwb_vals"]
+        self.stats = [RunningStats.from_state(stats) for stats in state["stats"]]
+        self.count1 = state["count1"]
+        self.count2 = state["count2"]
+        self.outofbounds_ct = state["outofbounds_ct"]
+        if self.table is not None and "table" in state:
+            self.table.restore(state["table"], os.path.join(directory, "table") if directory is not None else None)
+        if self.history is not None and "history" in state:
+            self.history.restore(state["history"], os.path.join(directory, "history") if directory is not None else None)
+
+# bin edges of the histogram of a variable if its plot range is fixed by a threshold range, otherwise None
+
+def hist_edges(threshold):
     if isinstance(threshold, list):
-        if val < threshold[0] or val > threshold[1]:
-            outofbounds_ct += 1
-    elif threshold is None:
-        pass
+        return np.linspace(threshold[0], threshold[1], hist_bins + 1)
+    return None
+
+# function collecting the values of the selected variables for all Powerboards in "testRuns_bycode", and returning "prod_pwb_vals", "count2" and "outofbounds_ct" as described for "Extraction"
+
+def extract(testRuns_bycode, selections, progress = True, table = None):
+    extraction = Extraction(selections, progress = progress, table = table)
+    for pwb_code, testRuns in testRuns_bycode.items():
+        extraction.add_board(pwb_code, testRuns)
+    return extraction.prod_pwb_vals, extraction.count2, extraction.outofbounds_ct
+
+# selection of a variable at one stage: the temperature is dropped for "Thermal Cycling", which only runs warm tests, and cold variables are not measured there (None)
+
+def stage_selection(stage, selection):
+    val_name, state, temp, test_type = selection
+    if stage != "THERMAL":
+        return selection
+    if temp == "Cold":
+        return None
+    return (val_name, state, None, test_type)
+
+def stage_selections(stage, selections):
+    return [selection for selection in (stage_selection(stage, selection) for selection in selections) if selection is not None]
+
+# class comparing the values of the same Powerboards at several stages, e.g. after Die Attachment and Bonding and after Burn-In, from test runs fetched for all stages in one crawl (see "crawl"). the selections are given with Warm/Cold temperatures, and every stage has its own "Extraction" in "extractions", with its own "ValueTable" and "RetestHistory" if given in "tables" and "histories", keyed by stage
+
+# the first stage is the reference: for every Powerboard with a value of a variable at both the reference and a later stage, the shift of the value (later minus reference) is added to a "RunningStats" in "deltas" and, with the Powerboard id code, to "board_deltas", both keyed by (stage, index of the selection)
+
+class StageComparison:
+    def __init__(self, stage_list, selections, progress = True, tables = None, histories = None):
+        self.stages = stage_list
+        self.selections = selections
+        self.progress = progress
+        self.extractions = {}
+        self.stage_index = {}
+        for stage in stage_list:
+            self.stage_index[stage] = [i for i, selection in enumerate(selections) if stage_selection(stage, selection) is not None]
+            self.extractions[stage] = Extraction(stage_selections(stage, selections), progress = False, table = (tables or {}).get(stage), keep_values = False, history = (histories or {}).get(stage))
+        self.deltas = {}
+        self.board_deltas = {}
+        for stage in stage_list[1:]:
+            for i in self.stage_index[stage]:
+                if i in self.stage_index[stage_list[0]]:
+                    self.deltas[(stage, i)] = RunningStats()
+                    self.board_deltas[(stage, i)] = []
+        self.count1 = 0
+        self.count2 = [0 for stage in stage_list for i in self.stage_index[stage]]
+
+    # add the test runs of one Powerboard at every stage, given as a dictionary keyed by stage. as for "Extraction", the values of all stages are extracted before anything is added
+
+    def add_board(self, pwb_code, testRuns_bystage):
+        boards = {stage: self.extractions[stage].board_values(pwb_code, testRuns_bystage[stage]) for stage in self.stages}
+        numbers = {}
+        for stage in self.stages:
+            self.extractions[stage].add_values(pwb_code, boards[stage])
+            found, history, stage_numbers, dates = boards[stage]
+            numbers[stage] = {self.stage_index[stage][i]: number for (i, val, testRun, outside), number in zip(found, stage_numbers)}
+
+        reference = numbers[self.stages[0]]
+        for (stage, i), stats in self.deltas.items():
+            if i in reference and i in numbers[stage]:
+                delta = numbers[stage][i] - reference[i]
+                stats.add(delta)
+                self.board_deltas[(stage, i)].append([pwb_code, delta])
+
+        self.count1 += 1
+        self.count2 = [n for stage in self.stages for n in self.extractions[stage].count2]
+        if self.progress:
+            print("\n", pwb_code)
+            print(", ".join(f"{len(boards[stage][0])} variables found at {stage}" for stage in self.stages) + ",", self.count1)
+
+    # the stats of a selection at every stage where it was measured, as a list of (stage, RunningStats, number outside of the threshold)
+
+    def stage_stats(self, i):
+        stats = []
+        for stage in self.stages:
+            if i in self.stage_index[stage]:
+                n = self.stage_index[stage].index(i)
+                stats.append((stage, self.extractions[stage].stats[n], self.extractions[stage].outofbounds_ct[n]))
+        return stats
+
+    # print, for every variable, the number of values, median, standard deviation and number outside of the threshold at every stage, and the median and standard deviation of the shift of each Powerboard from the reference stage
+
+    def report(self):
+        for i, (val_name, state, temp, test_type) in enumerate(self.selections):
+            name = " ".join(part for part in [temp, val_name, state] if part is not None)
+            print(f"\n{name}")
+            for stage, stats, outside in self.stage_stats(i):
+                if len(stats) > 0:
+                    print(f"    {stage}: {len(stats)} values, median = {stats.median():.3g}, sigma = {stats.std():.3g}, {outside} outside threshold")
+            for stage in self.stages[1:]:
+                stats = self.deltas.get((stage, i))
+                if stats is not None and len(stats) > 0:
+                    print(f"    {stage} - {self.stages[0]}: {len(stats)} Powerboards, median shift = {stats.median():.3g}, sigma = {stats.std():.3g}")
+
+    # the shifts of every Powerboard as a table of numpy arrays, with one row per Powerboard, variable and later stage, e.g. to be saved with "value_store.save_table"
+
+    def delta_table(self, pwb_serials = None):
+        pwb_serials = pwb_serials if pwb_serials is not None else {}
+        rows = {column: [] for column in ["serialNumber", "code", "stage", "reference", "temp", "variable", "state", "delta"]}
+        for (stage, i), board_deltas in self.board_deltas.items():
+            val_name, state, temp, test_type = self.selections[i]
+            for pwb_code, delta in board_deltas:
+                rows["serialNumber"].append(pwb_serials.get(pwb_code) or "")
+                rows["code"].append(pwb_code)
+                rows["stage"].append(stage)
+                rows["reference"].append(self.stages[0])
+                rows["temp"].append(temp or "")
+                rows["variable"].append(val_name)
+                rows["state"].append(state or "")
+                rows["delta"].append(delta)
+        return {column: np.array(values, dtype = np.float64 if column == "delta" else str) for column, values in rows.items()}
+
+    def state(self, directory = None):
+        return {
+            "stages": self.stages,
+            "extractions": {stage: extraction.state(os.path.join(directory, stage) if directory is not None else None) for stage, extraction in self.extractions.items()},
+            "deltas": [[stage, i, stats.state(), self.board_deltas[(stage, i)]] for (stage, i), stats in self.deltas.items()],
+            "count1": self.count1
+        }
+
+    def restore(self, state, directory = None):
+        if state["stages"] != self.stages:
+            raise ValueError("the saved values were extracted for different stages")
+        for stage, extraction in self.extractions.items():
+            extraction.restore(state["extractions"][stage], os.path.join(directory, stage) if directory is not None else None)
+        for stage, i, stats, board_deltas in state["deltas"]:
+            self.deltas[(stage, i)] = RunningStats.from_state(stats)
+            self.board_deltas[(stage, i)] = board_deltas
+        self.count1 = state["count1"]
+        self.count2 = [n for stage in self.stages for n in self.extractions[stage].count2]
+
+# errors raised by "add_board" for a test run that does not have the expected structure, e.g. a missing or too short result
+
+extraction_errors = (IndexError, KeyError, TypeError, ValueError, ZeroDivisionError)
+
+# function downloading and extracting the values of all Powerboards in batches of batch_size Powerboards. Powerboards whose id code is in "done" are skipped, and the id code of every Powerboard added to the extraction is added to "done". a Powerboard whose test runs cannot be downloaded or extracted is skipped, and the error is saved in "failures" under its id code. after every batch, "on_batch" is called, e.g. to save a checkpoint
+
+# with a list of stages, the test runs of every Powerboard at all of the stages are fetched in the same batches, and added to the extraction, e.g. a "StageComparison", as a dictionary keyed by stage
+
+# the test runs are projected to compact "SlimRun" records holding only the results of the selected variables of the extraction (see "run_projection") as soon as they are received, unless slim is False, in which case the full JSON of every test run in a batch is kept until the batch is extracted
+
+# the lists of test runs already known can be given as "listings", see "fetch_stage_test_runs"
+
+# returns the number of test run requests, summed over all batches as returned by "fetch_stage_test_runs"
+
+def crawl(session, pwb_codes, stage, extraction, chunk_size = 100, workers = 1, cache = None, batch_size = 200, done = None, failures = None, on_batch = None, slim = True, listings = None):
+    stage_list = stage if isinstance(stage, list) else [stage]
+    project = run_projection(extraction.selections) if slim else None
+    done = done if done is not None else set()
+    failures = failures if failures is not None else {}
+    request_stats = {"requests": {"listTestRunsByComponent": 0, "getTestRunBulk": 0}, "per_board": {}, "unbatched": 0}
+
+    def run_batch(batch):
+        testRuns_bystage, batch_stats = fetch_stage_test_runs(session, batch, stage_list, chunk_size = chunk_size, workers = workers, cache = cache, failures = failures, project = project, listings = listings)
+        for endpoint, count in batch_stats["requests"].items():
+            request_stats["requests"][endpoint] += count
+        request_stats["per_board"].update(batch_stats["per_board"])
+        request_stats["unbatched"] += batch_stats["unbatched"]
+        for pwb_code in testRuns_bystage[stage_list[0]]:
+            testRuns = {stage: testRuns_bystage[stage][pwb_code] for stage in stage_list} if isinstance(stage, list) else testRuns_bystage[stage][pwb_code]
+            try:
+                with timers.phase("extraction"):
+                    extraction.add_board(pwb_code, testRuns)
+            except extraction_errors as e:
+                failures[pwb_code] = f"{type(e).__name__}: {e}"
+                print(f"\n{pwb_code} skipped: {failures[pwb_code]}")
+                continue
+            done.add(pwb_code)
+            failures.pop(pwb_code, None)
+        if on_batch is not None:
+            on_batch()
+
+    batch = []
+    for pwb_code in pwb_codes:
+        if pwb_code in done:
+            continue
+        batch.append(pwb_code)
+        if len(batch) == batch_size:
+            run_batch(batch)
+            batch = []
+    if len(batch) > 0:
+        run_batch(batch)
+    return request_stats
+
+# function to plot a list of values in a histogram, displaying the median, standard deviation, threshold values, and the number of measurements falling outside those thresholds (see "draw_hist" in plot_render.py). the values can also be given as "RunningStats", in which case the histogram is drawn from its counts without needing the values themselves. if a filename is given, the plot is rendered headless and saved to that file instead of being shown
+
+def hist_plot(vals, binnum, title, xlabel, threshold, outofbounds_ct, threshold_dir = None, val_name = None, filename = None):
+    args = (vals, binnum, title, xlabel, threshold, outofbounds_ct, threshold_dir, val_name)
+    if filename is not None:
+        render_plot((filename, draw_hist, args))
+        return
+    draw_hist(plt.gca(), *args)
+    plt.show()
+
+# function returning a file name for the plot of a variable in a file format ("png", "pdf" or "svg"), e.g. "BURN_IN_Warm_CALx_value_ON.png"
+
+def plot_filename(stage, val_name, state, temp, file_format = "png"):
+    name = "_".join(part for part in [stage, temp, val_name, state] if part is not None)
+    name = name.replace("%", "pct").replace("/", "")
+    return re.sub(r"[^A-Za-z0-9_.+-]+", "_", name) + "." + file_format
+
+
+# function plotting the lists of values of the selected variables in histograms. the values of each variable can be a list or a "RunningStats". for several variables, the temperature is added to each title and the number of values collected and outside of the threshold is printed
+
+# if an output directory is given, every plot is rendered headless and saved in that directory in each of the file formats, spread over "workers" processes. otherwise the plots are shown one after the other
+
+def plot_selections(stage, selections, prod_pwb_vals, outofbounds_ct, output_dir = None, file_formats = ["png"], workers = 1):
+    if output_dir is not None:
+        os.makedirs(output_dir, exist_ok = True)
+
+    tasks = []
+    for i, (val_name, state, temp, test_type) in enumerate(selections):
+        threshold, threshold_dir, title, xlabel = variable_settings(val_name, state, temp)
+        if len(selections) > 1:
+            title = f"{title}, {temp}" if temp is not None else title
+            print(f"{title}: {len(prod_pwb_vals[i])} values, {outofbounds_ct[i]} outside threshold")
+        if len(prod_pwb_vals[i]) == 0:
+            print(f"No values found for {title}.")
+            continue
+        args = (prod_pwb_vals[i], hist_bins, title, xlabel, threshold, outofbounds_ct[i], threshold_dir, val_name)
+        if output_dir is None:
+            hist_plot(*args)
+            continue
+        for file_format in file_formats:
+            tasks.append((os.path.join(output_dir, plot_filename(stage, val_name, state, temp, file_format)), draw_hist, args))
+
+    if len(tasks) > 0:
+        render_plots(tasks, workers)
+        print(f"\n{len(tasks)} plots saved to {output_dir}")
+
+# function plotting a "StageComparison": for every variable, the histograms of all stages overlaid on one plot (e.g. "BONDED_vs_BURN_IN_Warm_VOUT_ON.png"), and a histogram of the shift of every Powerboard from the reference stage for each later stage (e.g. "BURN_IN_minus_BONDED_Warm_VOUT_ON.png"). as for "plot_selections", the plots are saved in output_dir if it is given, otherwise they are shown one after the other
+
+def plot_comparison(comparison, output_dir = None, file_formats = ["png"], workers = 1):
+    if output_dir is not None:
+        os.makedirs(output_dir, exist_ok = True)
+    reference = comparison.stages[0]
+
+    plots = []
+    for i, (val_name, state, temp, test_type) in enumerate(comparison.selections):
+        threshold, threshold_dir, title, xlabel = variable_settings(val_name, state, temp)
+        title = f"{title}, {temp}" if temp is not None else title
+        stage_stats = [(stage, stats) for stage, stats, outside in comparison.stage_stats(i) if len(stats) > 0]
+        if len(stage_stats) == 0:
+            print(f"No values found for {title}.")
+            continue
+        plots.append(("_vs_".join(stage for stage, stats in stage_stats), val_name, state, temp, draw_overlay, (stage_stats, hist_bins, title, xlabel, threshold)))
+        for stage in comparison.stages[1:]:
+            stats = comparison.deltas.get((stage, i))
+            if stats is not None and len(stats) > 0:
+                plots.append((f"{stage}_minus_{reference}", val_name, state, temp, draw_hist, (stats, hist_bins, f"{title}: {stage} - {reference}", f"Shift ({xlabel})" if xlabel is not None else "Shift", None, None)))
+
+    tasks = []
+    for name, val_name, state, temp, draw, args in plots:
+        if output_dir is None:
+            draw(plt.gca(), *args)
+            plt.show()
+            continue
+        for file_format in file_formats:
+            tasks.append((os.path.join(output_dir, plot_filename(name, val_name, state, temp, file_format)), draw, args))
+
+    if len(tasks) > 0:
+        render_plots(tasks, workers)
+        print(f"\n{len(tasks)} plots saved to {output_dir}")
+
+# the selected variables of the command line arguments "--all-variables", or "--variable", "--state", "--temp" and "--test-type". when comparing stages, the variables are selected with Warm/Cold temperatures, and only the warm ones are compared at "Thermal Cycling"
+
+def parse_selections(parser, args, stage_list):
+    if args.all_variables:
+        return all_selections(stage_list[0] if len(stage_list) == 1 else None)
+    val_name = resolve_variable(args.variable)
+    if val_name is None:
+        parser.error(f"unknown test variable '{args.variable}'")
+    temp = None
+    if any(stage != "THERMAL" for stage in stage_list):
+        if args.temp is None:
+            parser.error("--temp is required for stages other than Thermal Cycling")
+        temp = args.temp
+    state = None
+    if params[val_name]["offon"] == True:
+        if args.state is None:
+            parser.error(f"--state is required for {val_name}")
+        state = args.state
+    test_type = args.test_type if args.test_type is not None else params[val_name]["test_type"]
+    return [(val_name, state, temp, test_type)]
+
+# command line interface. the test variable is chosen with "--variable" (a key of "params", or e.g. "Scan PADID" or "-6%" for single variable tests and DC/DC Adjust percentages), or "--all-variables" for all of them. the ITk access codes are read from the ITKDB_ACCESS_CODE1 and ITKDB_ACCESS_CODE2 environment variables, and only asked for if these are not set
+
+# example: python prod_plot.py --stage Burn-In --temp Warm --variable CALx_value --state ON
+
+# "--stage" can be given several times to compare the same Powerboards at several stages from one crawl (see "StageComparison"), e.g. python prod_plot.py --stage BONDED --stage BURN_IN --temp Warm --variable VOUT --state ON --output-dir plots
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = "Histogram a QC test variable across all production Powerboards registered in the ITk database.")
+    parser.add_argument("--stage", action = "append", required = True, help = "testing stage: " + ", ".join(f"\"{name}\" ({code})" for name, code in stages.items()) + ". can be given several times to compare stages, the first is the reference the shifts of the values are computed from")
+    parser.add_argument("--temp", choices = ["Warm", "Cold"], help = "warm or cold tests, required for stages other than Thermal Cycling")
+    variable = parser.add_mutually_exclusive_group(required = True)
+    variable.add_argument("--variable", help = "test variable, e.g. HVIOUT, LDx2EN_value, AMACPTAT, EFFICIENCY, PADID or -6%% (use --variable=-6%%)")
+    variable.add_argument("--all-variables", action = "store_true", help = "extract every variable in params (all OFF/ON states, Warm/Cold temperatures and DC/DC Adjust percentages) in one pass and save all plots")
+    parser.add_argument("--state", choices = ["OFF", "ON"], help = "OFF or ON state, required for variables with an ON/OFF state")
+    parser.add_argument("--test-type", default = None, help = "name of the test the variable is measured in (default: from params)")
+    parser.add_argument("--output-dir", default = None, help = "directory the plots are saved to instead of being shown (default with --all-variables: plots)")
+    parser.add_argument("--format", dest = "formats", action = "append", choices = formats, help = "file format of the saved plots, can be given several times (default: png)")
+    parser.add_argument("--plot-workers", type = int, default = 1, help = "number of processes rendering the saved plots (default: 1)")
+    parser.add_argument("--values-dir", default = None, help = "directory the extracted values are saved to as a table of .npy columns, see value_store.py")
+    parser.add_argument("--page-size", type = int, default = 100, help = "number of components received per listComponents page (default: 100)")
+    parser.add_argument("--chunk-size", type = int, default = 100, help = "number of test run ids requested per getTestRunBulk call (default: 100)")
+    parser.add_argument("--workers", type = int, default = 1, help = "number of concurrent download threads, 1 downloads serially (default: 1)")
+    parser.add_argument("--max-rps", type = float, default = 10.0, help = "maximum requests per second sent to the ITk database by all threads together, 0 for no limit (default: 10)")
+    parser.add_argument("--cache-dir", default = None, help = "directory of a local cache of downloaded test runs. only test runs that are new or have a changed stateTs are downloaded (default: no cache)")
+    parser.add_argument("--refresh", action = "store_true", help = "download all test runs again and overwrite the cached copies")
+    parser.add_argument("--checkpoint", default = None, help = "file the progress and extracted values are saved to after every batch of Powerboards (default: no checkpoints)")
+    parser.add_argument("--checkpoint-every", type = int, default = 200, help = "number of Powerboards downloaded and extracted per batch (default: 200)")
+    parser.add_argument("--retests", action = "store_true", help = "keep the history of all runs of every Powerboard and print how often Powerboards failed a test and passed a retest")
+    parser.add_argument("--resume", action = "store_true", help = "continue from the --checkpoint file, skipping the Powerboards already processed")
+    parser.add_argument("--report", default = None, help = "file a JSON report of the run is written to: time per phase, requests per endpoint, Powerboards skipped and why, and peak memory")
+    parser.add_argument("--profile", default = None, help = "profile the run with cProfile and save the statistics to this file")
+    parser.add_argument("--trace-memory", action = "store_true", help = "measure the peak memory allocated by Python with tracemalloc (slower)")
+    args = parser.parse_args(argv)
+
+    stage_list = []
+    for name in args.stage:
+        stage = stages.get(name, name)
+        if stage not in stages.values():
+            parser.error("please choose a valid testing stage: " + ", ".join(stages))
+        if stage not in stage_list:
+            stage_list.append(stage)
+    compare = len(stage_list) > 1
+    stage = stage_list if compare else stage_list[0]
+
+    selections = parse_selections(parser, args, stage_list)
+
+# with "--resume", the values, counts and Powerboards already processed are restored from the checkpoint. Powerboards that failed before are tried again. the value table and retest history are saved next to the checkpoint, in a directory named after it followed by ".segments", one segment per batch
+
+    pwb_serials = {}
+    tables = {stage: ValueTable(stage, pwb_serials) for stage in stage_list} if args.values_dir is not None else {}
+    histories = {stage: RetestHistory(stage, stage_selections(stage, selections)) for stage in stage_list} if args.retests else {}
+    if compare:
+        extraction = StageComparison(stage_list, selections, tables = tables, histories = histories)
     else:
-        if threshold_dir == "less":
-            if val > threshold:
-                outofbounds_ct += 1
-        elif threshold_dir == "more":
-            if val < threshold:
-                outofbounds_ct += 1
-        else:
-            if val != threshold:
-                outofbounds_ct += 1
+        extraction = Extraction(selections, table = tables.get(stage), keep_values = False, history = histories.get(stage))
+    done = set()
+    failures = {}
+    segments_dir = args.checkpoint + ".segments" if args.checkpoint is not None else None
+    if args.resume:
+        if args.checkpoint is None:
+            parser.error("--resume requires --checkpoint")
+        state = load_checkpoint(args.checkpoint)
+        if state is not None:
+            if state["stage"] != stage:
+                parser.error(f"the checkpoint {args.checkpoint} was saved for stage {state['stage']}")
+            try:
+                extraction.restore(state["extraction"], segments_dir)
+            except (ValueError, OSError) as e:
+                parser.error(f"the checkpoint {args.checkpoint} cannot be resumed: {e}")
+            done = set(state["done"])
+            failures = state["failures"]
+            print(f"resuming from {args.checkpoint}: {len(done)} Powerboards already processed, {len(failures)} failed")
 
-    prod_pwb_vals.append(val)
-    reauthenticate()
+    def save():
+        if args.checkpoint is not None:
+            with timers.phase("checkpoint"):
+                save_checkpoint(args.checkpoint, {"stage": stage, "done": sorted(done), "failures": failures, "extraction": extraction.state(segments_dir)})
+
+# the whole run is timed, and optionally profiled. the JSON report is also written if the run stops early, e.g. when interrupted, with "completed" set to false
+
+    session = None
+    cache = None
+    request_stats = None
+    profiler = Profiler(profile_path = args.profile, trace_memory = args.trace_memory)
+    profiler.start()
+    completed = False
+    try:
+        code1 = os.environ.get("ITKDB_ACCESS_CODE1") or getpass.getpass("ITk Access Code 1?\n")
+        code2 = os.environ.get("ITKDB_ACCESS_CODE2") or getpass.getpass("ITk Access Code 2?\n")
+        try:
+            session = ITkSession(code1, code2, max_rps = args.max_rps, background_refresh = True)
+        except RuntimeError:
+            print('Login unsuccessful...')
+            sys.exit(1)
+
+        pwb_codes = iter_components(session, page_size = args.page_size, pwb_serials = pwb_serials)
+
+        if args.cache_dir is not None:
+            cache = TestRunCache(args.cache_dir, refresh = args.refresh)
+        request_stats = crawl(session, pwb_codes, stage, extraction, chunk_size = args.chunk_size, workers = args.workers, cache = cache, batch_size = args.checkpoint_every, done = done, failures = failures, on_batch = save)
+        if cache is not None:
+            print("\ntest run cache:", cache.stats())
+
+# optional print statement comparing the number of requests made with the number that one "getTestRunBulk" call per test run would have needed
+
+        board_ct = len(request_stats["per_board"])
+        if board_ct > 0:
+            per_board = sum(request_stats["per_board"].values()) / board_ct
+            per_board_unbatched = request_stats["unbatched"] / board_ct
+            print("\nrequests per endpoint:", request_stats["requests"])
+            print(f"requests per Powerboard: {per_board:.2f} (one request per test run: {per_board_unbatched:.2f})")
+            print(f"total test run requests: {sum(request_stats['requests'].values())} (one request per test run: {request_stats['unbatched']})")
+
+        for history_stage, history in histories.items():
+            print(f"\nretests at {history_stage}:" if compare else "\nretests:")
+            history.report()
+
+        if compare:
+            print("\ncomparison of the stages:")
+            extraction.report()
+
+        if len(failures) > 0:
+            print(f"\n{len(failures)} Powerboards skipped:")
+            for pwb_code, error in failures.items():
+                print(f"    {pwb_code}: {error}")
+
+# the values of all stages are saved in one table, and the shifts between the stages in its "stage_deltas" subdirectory
+
+        if args.values_dir is not None:
+            with timers.phase("save values"):
+                save_table(args.values_dir, concat_tables([table.to_arrays() for table in tables.values()]))
+                if compare:
+                    save_table(os.path.join(args.values_dir, "stage_deltas"), extraction.delta_table(pwb_serials))
+            print(f"\n{sum(len(table) for table in tables.values())} values saved to {args.values_dir}")
+
+        output_dir = args.output_dir
+        if args.all_variables and output_dir is None:
+            output_dir = "plots"
+        with timers.phase("plotting"):
+            if compare:
+                plot_comparison(extraction, output_dir = output_dir, file_formats = args.formats or ["png"], workers = args.plot_workers)
+            else:
+                plot_selections(stage, selections, extraction.stats, extraction.outofbounds_ct, output_dir = output_dir, file_formats = args.formats or ["png"], workers = args.plot_workers)
 
-# optional print statement which helps keep track of progress while the code is running. for each loop through the list of pwb codes, the value of interest is printed, as well as an iteration count (count1), the number of values collected (count2), and the number of values outside of the threshold (outofbounds_ct)
-    
-    print(val, "\n",  count1, count2, outofbounds_ct)
+# print the number of requests, retries, time, latency histogram and bytes received per endpoint, and the time spent in each phase
 
-# plot the list of values in a histogram    
+        print("\nrequest metrics per endpoint:")
+        session.metrics.report()
+        print("\ntime per phase:")
+        timers.report()
+        completed = True
+    finally:
+        profiler.stop()
+        if session is not None:
+            session.close()
+        if args.report is not None:
+            report = {
+                "completed": completed,
+                "arguments": vars(args),
+                "stage": stage,
+                "boards": extraction.count1,
+                "values": sum(extraction.count2),
+                "skipped": failures,
+                "phases": timers.summary(),
+                "requests": session.metrics.summary() if session is not None else {},
+                "test_run_requests": request_stats["requests"] if request_stats is not None else None,
+                "cache": cache.stats() if cache is not None else None
+            }
+            report.update(profiler.summary())
+            write_report(args.report, report)
+            print(f"\nrun report saved to {args.report}")
+        if cache is not None:
+            cache.close()
 
-hist_plot(prod_pwb_vals, 50, title, xlabel, threshold, outofbounds_ct)
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+import sys
+import json
+import time
+import pstats
+import cProfile
+import threading
+import tracemalloc
+
+# timers of the phases of a run (authentication, listing, downloading, timestamp parsing, extraction, plotting, ...), shared by all modules through "timers". a phase is timed with
+
+#     with timers.phase("extraction"):
+#         ...
+
+# for every phase, the number of calls, the total time, and the time not spent in other phases nested within it ("self_seconds") are recorded. phases run by the download threads are summed over all threads, so with several workers their time can be longer than the time of the whole run
+
+class PhaseTimers:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.phases = {}
+
+    def phase(self, name):
+        return Phase(self, name)
+
+    def record(self, name, seconds, self_seconds):
+        with self.lock:
+            if name not in self.phases:
+                self.phases[name] = {"calls": 0, "seconds": 0.0, "self_seconds": 0.0}
+            phase = self.phases[name]
+            phase["calls"] += 1
+            phase["seconds"] += seconds
+            phase["self_seconds"] += self_seconds
+
+    # the time spent in the phases already running in this thread
+
+    def stack(self):
+        if not hasattr(self.local, "stack"):
+            self.local.stack = []
+        return self.local.stack
+
+    def summary(self):
+        with self.lock:
+            return {name: {"calls": phase["calls"], "seconds": round(phase["seconds"], 4), "self_seconds": round(phase["self_seconds"], 4)} for name, phase in self.phases.items()}
+
+    def reset(self):
+        with self.lock:
+            self.phases = {}
+
+    # print one line per phase, the slowest first
+
+    def report(self):
+        for name, phase in sorted(self.summary().items(), key = lambda item: -item[1]["seconds"]):
+            print(f"{name}: {phase['seconds']:.2f} s in {phase['calls']} calls ({phase['self_seconds']:.2f} s outside of nested phases)")
+
+class Phase:
+    def __init__(self, timers, name):
+        self.timers = timers
+        self.name = name
+
+    def __enter__(self):
+        self.stack = self.timers.stack()
+        self.stack.append(0.0)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        seconds = time.perf_counter() - self.start
+        nested = self.stack.pop()
+        if len(self.stack) > 0:
+            self.stack[-1] += seconds
+        self.timers.record(self.name, seconds, seconds - nested)
+        return False
+
+timers = PhaseTimers()
+
+# optional profiling of a whole run: with profile_path, the run is profiled with cProfile, the statistics are saved to that file (readable with "python -m pstats") and the slowest functions are printed. with trace_memory = True, the peak of the memory allocated by Python is measured with tracemalloc. both slow the run down
+
+class Profiler:
+    def __init__(self, profile_path = None, trace_memory = False):
+        self.profile_path = profile_path
+        self.trace_memory = trace_memory
+        self.profile = None
+        self.traced_peak = None
+        self.start_time = None
+        self.seconds = None
+
+    def start(self):
+        self.start_time = time.perf_counter()
+        if self.trace_memory:
+            tracemalloc.start()
+        if self.profile_path is not None:
+            self.profile = cProfile.Profile()
+            self.profile.enable()
+
+    def stop(self):
+        if self.profile is not None:
+            self.profile.disable()
+            self.profile.dump_stats(self.profile_path)
+            print(f"\nprofile saved to {self.profile_path}, slowest functions:")
+            pstats.Stats(self.profile, stream = sys.stdout).sort_stats("cumulative").print_stats(15)
+        if self.trace_memory:
+            self.traced_peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+        self.seconds = time.perf_counter() - self.start_time
+
+    # wall time of the run and peak memory: the maximum resident set size of the process (see "max_rss_mb") and, if traced, the peak of the memory allocated by Python
+
+    def summary(self):
+        return {
+            "wall_seconds": round(self.seconds, 3) if self.seconds is not None else None,
+            "max_rss_mb": max_rss_mb(),
+            "traced_peak_mb": round(self.traced_peak / 2 ** 20, 1) if self.traced_peak is not None else None
+        }
+
+# maximum resident set size of the process in MB, or None where the "resource" module does not exist (Windows). "ru_maxrss" is given in bytes on macOS and in kB on Linux and the other Unix systems
+
+def max_rss_mb():
+    try:
+        import resource
+    except ImportError:
+        return None
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(max_rss / 2 ** 20 if sys.platform == "darwin" else max_rss / 1024, 1)
+
+def write_report(path, report):
+    with open(path, "w") as f:
+        json.dump(report, f, indent = 1)
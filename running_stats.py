@@ -0,0 +1,137 @@
+import numpy as np
+
+# incremental statistics of a stream of values, updated one value at a time, so the median and standard deviation of a variable can be reported while the Powerboards are still being downloaded, and its histogram can be plotted without keeping every value
+
+# the count, mean and variance are updated with Welford's algorithm, and the minimum, maximum and number of values passing and failing the threshold are counted exactly. quantiles and histograms of arbitrary range are computed from a compacting sample: the values are kept exactly until "capacity" of them are buffered, after which the buffer is sorted and every other value is kept with twice the weight, in levels of increasing weight. quantiles are exact as long as nothing was compacted, and memory stays below about capacity * log2(count / capacity) values however many values are added
+
+# if bin edges are given, a fixed-bin histogram over those edges is also counted exactly as values arrive
+
+class RunningStats:
+    def __init__(self, capacity = 4096, edges = None):
+        self.capacity = capacity
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = None
+        self.max = None
+        self.passed = 0
+        self.failed = 0
+        self.levels = [[]]
+        self.compactions = 0
+        self.edges = np.asarray(edges, dtype = np.float64) if edges is not None else None
+        self.counts = np.zeros(len(self.edges) - 1, dtype = np.int64) if edges is not None else None
+
+    def add(self, val, passed = True):
+        val = float(val)
+        self.count += 1
+        delta = val - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (val - self.mean)
+        self.min = val if self.min is None else min(self.min, val)
+        self.max = val if self.max is None else max(self.max, val)
+        if passed:
+            self.passed += 1
+        else:
+            self.failed += 1
+
+        if self.edges is not None and self.edges[0] <= val <= self.edges[-1]:
+            self.counts[min(np.searchsorted(self.edges, val, side = "right") - 1, len(self.counts) - 1)] += 1
+
+        self.levels[0].append(val)
+        level = 0
+        while len(self.levels[level]) >= self.capacity:
+            self.compact(level)
+            level += 1
+
+    def __len__(self):
+        return self.count
+
+    # halve the values of one level into the next level. the kept half alternates between the even and odd positions on every compaction, so the sample is not biased towards small or large values
+
+    def compact(self, level):
+        if level + 1 == len(self.levels):
+            self.levels.append([])
+        values = sorted(self.levels[level])
+        self.levels[level + 1].extend(values[self.compactions % 2::2])
+        self.levels[level] = []
+        self.compactions += 1
+
+    def variance(self):
+        return self.m2 / self.count if self.count > 0 else float("nan")
+
+    # population standard deviation, as "np.std"
+
+    def std(self):
+        return self.variance() ** 0.5
+
+    def exact(self):
+        return len(self.levels) == 1
+
+    # the sampled values and their weights, sorted by value
+
+    def sample(self):
+        values = np.concatenate([np.asarray(values, dtype = np.float64) for values in self.levels])
+        weights = np.concatenate([np.full(len(values), 2 ** level, dtype = np.int64) for level, values in enumerate(self.levels)])
+        order = np.argsort(values, kind = "stable")
+        return values[order], weights[order]
+
+    # the q-th quantile (0 <= q <= 1). while no values have been compacted it is the same as "np.quantile", otherwise it is the sampled value below which a fraction q of the total weight lies
+
+    def quantile(self, q):
+        if self.count == 0:
+            return float("nan")
+        if self.exact():
+            return float(np.quantile(self.levels[0], q))
+        values, weights = self.sample()
+        cumulative = np.cumsum(weights)
+        index = np.searchsorted(cumulative, q * cumulative[-1], side = "left")
+        return float(values[min(index, len(values) - 1)])
+
+    def median(self):
+        return self.quantile(0.5)
+
+    # histogram counts and bin edges of the values, as "np.histogram(values, bins, range)". the exact fixed-bin counts are returned if they were counted over the same bins, otherwise the counts are estimated from the sample
+
+    def histogram(self, bins, range):
+        edges = np.linspace(range[0], range[1], bins + 1)
+        if self.edges is not None and np.array_equal(edges, self.edges):
+            return self.counts.copy(), edges
+        values, weights = self.sample()
+        counts, edges = np.histogram(values, bins = bins, range = range, weights = weights)
+        return counts.astype(np.int64), edges
+
+    # the statistics as a dictionary that can be saved as JSON, and restored with "from_state"
+
+    def state(self):
+        return {
+            "capacity": self.capacity,
+            "count": self.count,
+            "mean": self.mean,
+            "m2": self.m2,
+            "min": self.min,
+            "max": self.max,
+            "passed": self.passed,
+            "failed": self.failed,
+            "levels": self.levels,
+            "compactions": self.compactions,
+            "edges": self.edges.tolist() if self.edges is not None else None,
+            "counts": self.counts.tolist() if self.counts is not None else None
+        }
+
+    @classmethod
+    def from_state(cls, state):
+        stats = cls(state["capacity"], state["edges"])
+        for key in ["count", "mean", "m2", "min", "max", "passed", "failed", "levels", "compactions"]:
+            setattr(stats, key, state[key])
+        if state["counts"] is not None:
+            stats.counts = np.array(state["counts"], dtype = np.int64)
+        return stats
+
+    # statistics of a list of values
+
+    @classmethod
+    def from_values(cls, vals, capacity = 4096, edges = None):
+        stats = cls(capacity, edges)
+        for val in vals:
+            stats.add(val)
+        return stats
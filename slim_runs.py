@@ -0,0 +1,42 @@
+import sys
+from timestamps import run_times
+
+# compact test runs holding only what the extraction uses: the id, the name of the test, the unix timestamps of "stateTs" and "date", and some of the results. the full JSON of a test run from "getTestRunBulk" also holds the component, institution, user, properties, comments, defects and every result, of which only a few are needed for the selected variables
+
+# the results are kept in "results" as a dictionary of values keyed by result name (the first result of each name, as in "index_results"), and, for the results read by their position (e.g. the CTAToffset at position 2 of a "Temperatures" test), in "positions" keyed by position. test and result names are interned, so every run shares the same string objects
+
+class SlimRun:
+    __slots__ = ("id", "test_type", "_unix_stateTs", "_unix_date", "results", "positions")
+
+    def __init__(self, run_id, test_type, state_time, date_time, results, positions):
+        self.id = run_id
+        self.test_type = test_type
+        self._unix_stateTs = state_time
+        self._unix_date = date_time
+        self.results = results
+        self.positions = positions
+
+# convert a list of test runs to "SlimRun". "names" gives the result names kept for every test name, and "positions" the result positions kept for every test name; results of tests not in "names" or "positions" are dropped. with names = None, all results are kept, and with positions = None, all positions are kept. test runs that already are a "SlimRun" are returned as they are
+
+def slim_runs(testRuns, names = None, positions = None):
+    raw = [testRun for testRun in testRuns if not isinstance(testRun, SlimRun)]
+    if len(raw) == 0:
+        return list(testRuns)
+    state_times = dict(zip(map(id, raw), run_times(raw, "stateTs").tolist()))
+    date_times = dict(zip(map(id, raw), run_times(raw, "date").tolist()))
+
+    slim = []
+    for testRun in testRuns:
+        if isinstance(testRun, SlimRun):
+            slim.append(testRun)
+            continue
+        test_type = sys.intern(testRun['testType']['name'])
+        kept_names = names.get(test_type, ()) if names is not None else None
+        kept_positions = positions.get(test_type, ()) if positions is not None else range(len(testRun['results']))
+        results = {}
+        for result in testRun['results']:
+            if kept_names is None or result['name'] in kept_names:
+                results.setdefault(sys.intern(result['name']), result['value'])
+        run_positions = {position: testRun['results'][position]['value'] for position in kept_positions if position < len(testRun['results'])}
+        slim.append(SlimRun(testRun['id'], test_type, state_times[id(testRun)], date_times[id(testRun)], results, run_positions))
+    return slim
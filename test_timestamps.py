@@ -0,0 +1,39 @@
+import warnings
+import pytest
+import prod_plot
+from itk_session import ITkSession
+from mock_itkdb import MockDatabase
+from timestamps import parse_time, parse_times
+
+# a test run whose "date" is null is reported as a malformed test run, however many runs are parsed together
+
+@pytest.mark.parametrize("count", [1, 8])
+def test_parse_null_date(count):
+    with pytest.raises(ValueError):
+        parse_times(["2024-03-01T10:00:00.123Z"] * (count - 1) + [None])
+    with pytest.raises(ValueError):
+        parse_time(None)
+
+# a crawl in which one test run has no "date" skips only the Powerboard of that run, with and without the projection to compact records
+
+@pytest.mark.parametrize("slim", [True, False])
+def test_crawl_null_date(slim):
+    database = MockDatabase(boards = 5)
+    test_run = database.test_run
+    database.test_run = lambda run_id: dict(test_run(run_id), date = None) if run_id == "1.BURN_IN.0.0.0" else test_run(run_id)
+    session = ITkSession("", "", max_rps = 0, user_factory = database.user, client_factory = database.client)
+    extraction = prod_plot.Extraction(prod_plot.all_selections("BURN_IN"), progress = False, keep_values = False)
+    failures = {}
+    prod_plot.crawl(session, prod_plot.iter_components(session), "BURN_IN", extraction, failures = failures, slim = slim)
+    session.close()
+    assert list(failures) == ["mock000001"]
+    assert "ValueError" in failures["mock000001"]
+    assert extraction.count1 == 4
+
+# timestamps with a time zone offset other than "Z" are parsed one at a time, without a numpy warning, and give the same times as in UTC
+
+def test_parse_offsets():
+    texts = ["2024-03-01T10:00:00.999+02:00", "2024-03-01T08:00:00Z", "2024-03-01T09:30:00+01:30", "2024-03-01T08:00:00.5Z"]
+    with warnings.catch_warnings():
+        warnings.simplefilter("error")
+        assert parse_times(texts).tolist() == [parse_time("2024-03-01T08:00:00Z")] * 4
@@ -0,0 +1,31 @@
+import prod_plot
+from mock_itkdb import MockDatabase
+from watch import Watch
+
+# a poll in which several Powerboards were retested computes the statistics of each changed variable again only once, after all Powerboards are added, and gives the same statistics as computing them from scratch
+
+def test_retests_rebuild_once():
+    database = MockDatabase(boards = 6)
+    watch = Watch("BURN_IN", prod_plot.all_selections("BURN_IN"))
+    codes = [database.component(board)["code"] for board in range(5)]
+    testRuns = {code: [database.test_run(run_id) for run_id, state_ts in database.run_list(code, "BURN_IN")] for code in codes}
+    for code in codes:
+        watch.add_board(code, testRuns[code])
+    watch.rebuild()
+
+    rebuilt = []
+    recompute = watch.recompute
+    watch.recompute = lambda i: (rebuilt.append(i), recompute(i))
+    retested = MockDatabase(boards = 6, seed = 2)
+    for code in codes[:3]:
+        watch.add_board(code, [retested.test_run(run_id) for run_id, state_ts in retested.run_list(code, "BURN_IN")])
+    assert rebuilt == []
+    watch.rebuild()
+    assert len(rebuilt) > 0
+    assert sorted(rebuilt) == sorted(set(rebuilt))
+    assert watch.stale == set()
+
+    fresh = [(len(stats), stats.median()) for stats in watch.stats]
+    for i in range(len(watch.selections)):
+        recompute(i)
+    assert fresh == [(len(stats), stats.median()) for stats in watch.stats]
@@ -0,0 +1,54 @@
+import os
+import json
+import zlib
+import sqlite3
+
+# local on-disk cache of full test runs as returned by "getTestRunBulk". every test run is stored as zlib-compressed JSON in an SQLite database, keyed by its test run id together with its "stateTs" upload timestamp
+
+# a cached test run is used as long as the "stateTs" listed by "listTestRunsByComponent" matches the cached one. if the listing has no "stateTs" for a run, the cached copy is used, since QC results are almost always only appended. with refresh = True, every lookup misses and all test runs are downloaded again and overwrite the cached copies
+
+class TestRunCache:
+    def __init__(self, cache_dir, refresh = False):
+        os.makedirs(cache_dir, exist_ok = True)
+        self.path = os.path.join(cache_dir, "testruns.sqlite")
+        self.refresh = refresh
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+        self.db = sqlite3.connect(self.path)
+        self.db.execute("CREATE TABLE IF NOT EXISTS testruns (id TEXT PRIMARY KEY, stateTs TEXT, payload BLOB)")
+        self.db.commit()
+
+    # return the cached test run with this id, or None if it is not cached, has a different "stateTs", or refresh was requested
+
+    def get(self, run_id, state_ts = None):
+        row = None
+        if not self.refresh:
+            row = self.db.execute("SELECT stateTs, payload FROM testruns WHERE id = ?", (str(run_id),)).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        if state_ts is not None and row[0] != state_ts:
+            self.misses += 1
+            self.stale += 1
+            return None
+        self.hits += 1
+        return json.loads(zlib.decompress(row[1]))
+
+    # store a list of test runs, replacing older copies with the same id
+
+    def put_many(self, testRuns):
+        rows = []
+        for testRun in testRuns:
+            payload = zlib.compress(json.dumps(testRun, separators = (",", ":")).encode())
+            rows.append((str(testRun['id']), testRun.get('stateTs'), payload))
+        self.db.executemany("INSERT OR REPLACE INTO testruns (id, stateTs, payload) VALUES (?, ?, ?)", rows)
+        self.db.commit()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        hit_rate = self.hits / lookups if lookups > 0 else 0.0
+        return {"hits": self.hits, "misses": self.misses, "stale": self.stale, "hit_rate": round(hit_rate, 3)}
+
+    def close(self):
+        self.db.close()
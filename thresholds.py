@@ -0,0 +1,49 @@
+import numpy as np
+
+# threshold rules of the test variables, evaluated either for one value at a time while the Powerboards are processed ("threshold_predicate"), or for whole arrays of values at once ("outside_mask", "paired_outside_mask"), e.g. to check the values saved with "value_store" again against new limits without downloading anything
+
+# a threshold is given as in "params": a [low, high] range, a single value with threshold_dir "less" (values must be below it) or "more" (values must be above it), a single value with threshold_dir None (values must be equal to it), or None for no threshold
+
+# function returning a predicate deciding whether a single value lies outside of the threshold
+
+def threshold_predicate(threshold, threshold_dir):
+    if isinstance(threshold, list):
+        low, high = threshold
+        return lambda val: val < low or val > high
+    elif threshold is None:
+        return lambda val: False
+    elif threshold_dir == "less":
+        return lambda val: val > threshold
+    elif threshold_dir == "more":
+        return lambda val: val < threshold
+    return lambda val: val != threshold
+
+# function returning a boolean array, True for every value outside of the threshold
+
+def outside_mask(vals, threshold, threshold_dir):
+    vals = np.asarray(vals, dtype = np.float64)
+    if isinstance(threshold, list):
+        return (vals < threshold[0]) | (vals > threshold[1])
+    elif threshold is None:
+        return np.zeros(len(vals), dtype = bool)
+    elif threshold_dir == "less":
+        return vals > threshold
+    elif threshold_dir == "more":
+        return vals < threshold
+    return vals != threshold
+
+# rule comparing the OFF and ON values of the same Powerboard: the ON value minus the OFF value must be more than "state_threshold". works on single values as well as arrays
+
+def state_outside(val_off, val_on, state_threshold):
+    return np.subtract(val_on, val_off) <= state_threshold
+
+# function evaluating a rule between two variables measured on the same Powerboards, e.g. the OFF and ON values of "HVIIN". the values of each variable are joined through their Powerboard id codes, which must be unique within each variable, and "rule(vals_a, vals_b)" returns True for every pair outside of the threshold. returns a boolean array for each variable, True for the values failing the rule. values without a partner cannot be evaluated and are not marked as failing
+
+def paired_outside_mask(codes_a, vals_a, codes_b, vals_b, rule):
+    common, index_a, index_b = np.intersect1d(codes_a, codes_b, assume_unique = True, return_indices = True)
+    outside = np.asarray(rule(np.asarray(vals_a, dtype = np.float64)[index_a], np.asarray(vals_b, dtype = np.float64)[index_b]), dtype = bool)
+    mask_a = np.zeros(len(codes_a), dtype = bool)
+    mask_b = np.zeros(len(codes_b), dtype = bool)
+    mask_a[index_a] = outside
+    mask_b[index_b] = outside
+    return mask_a, mask_b
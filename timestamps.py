@@ -0,0 +1,51 @@
+import datetime
+import numpy as np
+from profiling import timers
+
+# parsing of the ISO 8601 timestamps of the ITk database ("stateTs" and "date" of a test run, e.g. "2024-03-01T10:00:00.123Z") into unix timestamps in whole seconds. the timestamps are in UTC, and are read as UTC whatever the time zone of the computer, so the same test runs give the same times everywhere and around changes of daylight saving time. fractions of a second are cut off
+
+# the unix timestamp of every field of a test run is parsed once and kept on the test run itself, under "_unix_" followed by the name of the field, so the warm/cold matching, the choice of the latest run and the value table all share it
+
+utc = datetime.timezone.utc
+
+# number of timestamps from which they are parsed together by numpy rather than one at a time
+
+vector_size = 4
+
+# a timestamp that is not a string, e.g. the null "date" of a malformed test run, raises ValueError like a string that cannot be parsed, so it is handled as any other malformed test run
+
+def check_time(text):
+    if not isinstance(text, str):
+        raise ValueError(f"invalid timestamp: {text!r}")
+    return text
+
+def parse_time(text):
+    dt_object = datetime.datetime.fromisoformat(check_time(text))
+    if dt_object.tzinfo is None:
+        dt_object = dt_object.replace(tzinfo = utc)
+    return int(dt_object.timestamp())
+
+# parse a list of timestamps into an array of unix timestamps. numpy parses timestamps without a time zone, so if every timestamp is in UTC, the "Z" is removed and they are parsed by numpy together. otherwise, e.g. for timestamps with another time zone offset, which numpy would read with a warning, they are parsed one at a time. timestamps numpy cannot parse are also parsed one at a time
+
+def parse_times(texts):
+    texts = [check_time(text) for text in texts]
+    if len(texts) < vector_size or not all(text.endswith("Z") for text in texts):
+        return np.array([parse_time(text) for text in texts], dtype = np.int64)
+    try:
+        return np.array([text[:-1] for text in texts], dtype = "datetime64[s]").astype(np.int64)
+    except ValueError:
+        return np.array([parse_time(text) for text in texts], dtype = np.int64)
+
+# the unix timestamps of a field ("stateTs" or "date") of a list of test runs as an array, parsing only those not parsed before. compact test runs (see slim_runs.py) hold their timestamps as attributes of the same name
+
+def run_times(testRuns, field = "stateTs"):
+    key = "_unix_" + field
+    missing = [testRun for testRun in testRuns if isinstance(testRun, dict) and key not in testRun]
+    if len(missing) > 0:
+        with timers.phase("timestamp parsing"):
+            for testRun, unix_time in zip(missing, parse_times([testRun[field] for testRun in missing]).tolist()):
+                testRun[key] = unix_time
+    return np.array([testRun[key] if isinstance(testRun, dict) else getattr(testRun, key) for testRun in testRuns], dtype = np.int64)
+
+def run_time(testRun, field = "stateTs"):
+    return int(run_times([testRun], field)[0])
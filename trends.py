@@ -0,0 +1,140 @@
+import argparse
+import os
+import datetime
+import numpy as np
+import prod_plot
+from value_store import load_table, save_table, group_rows
+from plot_render import formats, draw_trend, render_plots
+
+# trends of the extracted values over the test date of the Powerboards, computed from a value table saved with "--values-dir" (see value_store.py), so drifts in the values and in the fraction failing the thresholds can be followed without downloading anything again
+
+# the test dates are divided into consecutive periods of "step" seconds (a week by default, starting on Mondays), and for the end of every period the median, mean, standard deviation, number of values and fraction outside of the threshold are computed over the values of the preceding "window" seconds. a window longer than the step gives rolling statistics, e.g. a four week window every week. the values are sorted by date once, so the values of every window are a contiguous slice found with a binary search, and the counts, sums and failures of all windows are taken from cumulative sums at once
+
+day = 86400
+week = 7 * day
+
+# unix time of a Monday, 1969-12-29 00:00 UTC, from which the periods are counted
+
+monday = -3 * day
+
+# function returning the trend of a set of values as a dictionary of arrays, with one element per period: "start" and "end" (unix times of the window), "count", "median", "mean", "sigma", "failures" and "failure_rate". windows without values have a count of 0 and NaN statistics
+
+def trend(dates, vals, passed, step = week, window = None):
+    window = window if window is not None else step
+    order = np.argsort(dates, kind = "stable")
+    dates = np.asarray(dates, dtype = np.int64)[order]
+    vals = np.asarray(vals, dtype = np.float64)[order]
+    failed = ~np.asarray(passed, dtype = bool)[order]
+    if len(dates) == 0:
+        return {key: np.array([]) for key in ["start", "end", "count", "median", "mean", "sigma", "failures", "failure_rate"]}
+
+    first_end = monday + ((dates[0] - monday) // step + 1) * step
+    ends = np.arange(first_end, dates[-1] + step + 1, step, dtype = np.int64)
+    lo = np.searchsorted(dates, ends - window, side = "left")
+    hi = np.searchsorted(dates, ends, side = "left")
+    count = hi - lo
+
+    centred = vals - vals.mean()
+    sum_vals = np.concatenate([[0.0], np.cumsum(centred)])
+    sum_squares = np.concatenate([[0.0], np.cumsum(centred ** 2)])
+    sum_failed = np.concatenate([[0], np.cumsum(failed)])
+    with np.errstate(invalid = "ignore", divide = "ignore"):
+        mean_centred = (sum_vals[hi] - sum_vals[lo]) / count
+        variance = np.maximum((sum_squares[hi] - sum_squares[lo]) / count - mean_centred ** 2, 0.0)
+        failures = sum_failed[hi] - sum_failed[lo]
+        failure_rate = failures / count
+    median = np.array([np.median(vals[start:end]) if end > start else np.nan for start, end in zip(lo, hi)])
+
+    return {
+        "start": ends - window,
+        "end": ends,
+        "count": count,
+        "median": median,
+        "mean": mean_centred + vals.mean(),
+        "sigma": np.sqrt(variance),
+        "failures": failures,
+        "failure_rate": failure_rate
+    }
+
+# function returning the trend of every (stage, temperature, variable, state) in a value table, as a list of ((stage, temperature, variable, state), trend) pairs. only the given variable, state, temperature and stage are included if they are given
+
+def table_trends(table, step = week, window = None, variable = None, state = None, temp = None, stage = None):
+    trends = []
+    for key, rows in group_rows(table, ["stage", "temp", "variable", "state"]):
+        if any(wanted is not None and wanted != value for wanted, value in zip([stage, temp, variable, state], key)):
+            continue
+        trends.append((key, trend(table["date"][rows], table["value"][rows], table["passed"][rows], step = step, window = window)))
+    return trends
+
+def format_date(unix_time):
+    return datetime.datetime.fromtimestamp(int(unix_time), datetime.timezone.utc).strftime("%Y-%m-%d")
+
+# print the trend of one variable as a table, one line per window with values
+
+def print_trend(name, trend):
+    print(f"\n{name}")
+    print(f"{'window':>23} {'count':>6} {'median':>10} {'sigma':>10} {'failed':>7}")
+    for i in np.flatnonzero(trend["count"] > 0):
+        print(f"{format_date(trend['start'][i])} - {format_date(trend['end'][i] - 1)} {trend['count'][i]:6d} {trend['median'][i]:10.3g} {trend['sigma'][i]:10.3g} {trend['failure_rate'][i] * 100:6.1f}%")
+
+# command line interface, e.g. for the weekly trend of CALx_value ON at Warm over a rolling four week window:
+
+#     python trends.py values --variable CALx_value --state ON --temp Warm --window-days 28 --output-dir trends
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = "Trends over test date of the values saved with prod_plot.py --values-dir.")
+    parser.add_argument("values_dir", help = "directory of a value table saved with prod_plot.py --values-dir")
+    parser.add_argument("--variable", default = None, help = "test variable (default: every variable in the table)")
+    parser.add_argument("--state", choices = ["OFF", "ON"], default = None)
+    parser.add_argument("--temp", choices = ["Warm", "Cold"], default = None)
+    parser.add_argument("--stage", default = None)
+    parser.add_argument("--step-days", type = float, default = 7, help = "length of every period in days (default: 7)")
+    parser.add_argument("--window-days", type = float, default = None, help = "length of the window the statistics of each period are computed over, in days (default: --step-days)")
+    parser.add_argument("--output-dir", default = None, help = "directory the trend plots are saved to (default: no plots)")
+    parser.add_argument("--format", dest = "formats", action = "append", choices = formats, help = "file format of the plots, can be given several times (default: png)")
+    parser.add_argument("--plot-workers", type = int, default = 1, help = "number of processes rendering the plots (default: 1)")
+    parser.add_argument("--table-dir", default = None, help = "directory the trends are saved to as a table of .npy columns")
+    parser.add_argument("--quiet", action = "store_true", help = "do not print the trend tables")
+    args = parser.parse_args(argv)
+
+    variable = prod_plot.resolve_variable(args.variable) if args.variable is not None else None
+    if args.variable is not None and variable is None:
+        parser.error(f"unknown test variable '{args.variable}'")
+    stage = prod_plot.stages.get(args.stage, args.stage)
+    step = int(args.step_days * day)
+    window = int(args.window_days * day) if args.window_days is not None else step
+
+    table = load_table(args.values_dir)
+    trends = table_trends(table, step = step, window = window, variable = variable, state = args.state, temp = args.temp, stage = stage)
+    if len(trends) == 0:
+        print("No values found.")
+        return
+
+    tasks = []
+    rows = {column: [] for column in ["stage", "temp", "variable", "state", "start", "end", "count", "median", "mean", "sigma", "failures", "failure_rate"]}
+    if args.output_dir is not None:
+        os.makedirs(args.output_dir, exist_ok = True)
+    for (stage, temp, val_name, state), values_trend in trends:
+        name = " ".join(part for part in [stage, temp, val_name, state] if part != "")
+        if not args.quiet:
+            print_trend(name, values_trend)
+        for column in ["stage", "temp", "variable", "state"]:
+            rows[column] += [{"stage": stage, "temp": temp, "variable": val_name, "state": state}[column]] * len(values_trend["end"])
+        for column in values_trend:
+            rows[column] += list(values_trend[column])
+        if args.output_dir is not None and val_name in prod_plot.params:
+            threshold, threshold_dir, title, ylabel = prod_plot.variable_settings(val_name, state or None, temp or None)
+            title = f"{title}, {temp}" if temp != "" else title
+            for file_format in args.formats or ["png"]:
+                filename = os.path.join(args.output_dir, "trend_" + prod_plot.plot_filename(stage, val_name, state or None, temp or None, file_format))
+                tasks.append((filename, draw_trend, (values_trend, title, ylabel, threshold)))
+
+    if len(tasks) > 0:
+        render_plots(tasks, args.plot_workers)
+        print(f"\n{len(tasks)} trend plots saved to {args.output_dir}")
+    if args.table_dir is not None:
+        save_table(args.table_dir, {column: np.array(values) for column, values in rows.items()})
+        print(f"\n{len(rows['end'])} trend rows saved to {args.table_dir}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+import os
+import json
+import numpy as np
+
+# columnar table of extracted QC values, with one row per value and one column per field. the table is saved as one ".npy" file per column in a directory, plus "table.json" listing the columns and the number of rows, so that later analyses and re-plots can load the values without downloading or parsing any test runs. string columns are saved as fixed width unicode arrays, so every column can be memory-mapped
+
+# columns of the table:
+#     serialNumber, code    Powerboard serial number and component id code
+#     stage, temp           testing stage and Warm/Cold temperature ("" for "Thermal Cycling")
+#     testType, variable    name of the test and the params key of the variable
+#     state                 OFF/ON state ("" for variables without an ON/OFF state)
+#     value                 extracted value
+#     date                  unix timestamp of the test run "date"
+#     runId                 test run id
+#     passed                True if the value lies within the threshold
+
+columns = ["serialNumber", "code", "stage", "temp", "testType", "variable", "state", "value", "date", "runId", "passed"]
+
+dtypes = {"value": np.float64, "date": np.int64, "passed": bool}
+
+# the rows are collected in memory in "rows". during a long download, the rows collected since the last checkpoint are written with "flush" to a new segment, a table directory named after the number of its first row, and removed from memory, so every checkpoint only writes the new rows. the segments are listed in "segments" and joined again by "to_arrays"
+
+class ValueTable:
+    def __init__(self, stage, pwb_serials = None):
+        self.stage = stage
+        self.pwb_serials = pwb_serials if pwb_serials is not None else {}
+        self.rows = {column: [] for column in columns}
+        self.segments = []
+        self.segment_rows = 0
+
+    # add the value of one selected variable, given as a (value name, OFF/ON state, Warm/Cold temperature, test name) tuple, for one Powerboard
+
+    def append(self, pwb_code, selection, val, passed, run_id, date):
+        val_name, state, temp, test_type = selection
+        row = {
+            "serialNumber": self.pwb_serials.get(pwb_code) or "",
+            "code": pwb_code,
+            "stage": self.stage,
+            "temp": temp or "",
+            "testType": test_type,
+            "variable": val_name,
+            "state": state or "",
+            "value": val,
+            "date": date,
+            "runId": str(run_id),
+            "passed": passed
+        }
+        for column in columns:
+            self.rows[column].append(row[column])
+
+    def __len__(self):
+        return self.segment_rows + len(self.rows["value"])
+
+    # the rows in memory as a dictionary of numpy arrays
+
+    def row_arrays(self):
+        arrays = {}
+        for column in columns:
+            if column in dtypes:
+                arrays[column] = np.array(self.rows[column], dtype = dtypes[column])
+            else:
+                arrays[column] = np.array(self.rows[column], dtype = str)
+        return arrays
+
+    # return the table, the segments followed by the rows in memory, as a dictionary of numpy arrays
+
+    def to_arrays(self):
+        if len(self.segments) == 0:
+            return self.row_arrays()
+        return concat_tables([load_table(segment, mmap = False) for segment in self.segments] + [self.row_arrays()])
+
+    # write the rows in memory to a new segment in "directory" and remove them from memory
+
+    def flush(self, directory):
+        n_rows = len(self.rows["value"])
+        if n_rows == 0:
+            return
+        segment = os.path.join(directory, f"rows-{self.segment_rows:09d}")
+        save_table(segment, self.row_arrays(), sync = True)
+        self.segments.append(segment)
+        self.segment_rows += n_rows
+        self.rows = {column: [] for column in columns}
+
+    # the table as a dictionary that can be saved as JSON, and restored with "restore". with a directory, the rows in memory are first flushed to a segment in it, and only the names of the segments are returned
+
+    def state(self, directory = None):
+        if directory is None:
+            return {"segments": self.segments, "segment_rows": self.segment_rows, "rows": self.rows}
+        self.flush(directory)
+        return {"segments": [os.path.basename(segment) for segment in self.segments], "segment_rows": self.segment_rows, "rows": self.rows}
+
+    def restore(self, state, directory = None):
+        if "segments" not in state:
+            state = {"segments": [], "segment_rows": 0, "rows": state}
+        self.segments = [os.path.join(directory, segment) if directory is not None else segment for segment in state["segments"]]
+        self.segment_rows = state["segment_rows"]
+        self.rows = state["rows"]
+
+    def save(self, directory):
+        save_table(directory, self.to_arrays())
+
+# save a dictionary of equally long numpy arrays as a table directory. with sync = True, every file is flushed to the disk before returning, e.g. before a checkpoint refers to the table
+
+def save_table(directory, arrays, sync = False):
+    os.makedirs(directory, exist_ok = True)
+    for column, array in arrays.items():
+        with open(os.path.join(directory, f"{column}.npy"), "wb") as f:
+            np.save(f, array)
+            if sync:
+                f.flush()
+                os.fsync(f.fileno())
+    n_rows = len(next(iter(arrays.values()))) if len(arrays) > 0 else 0
+    with open(os.path.join(directory, "table.json"), "w") as f:
+        json.dump({"columns": list(arrays), "rows": n_rows}, f, indent = 1)
+        if sync:
+            f.flush()
+            os.fsync(f.fileno())
+
+# load a table directory as a dictionary of numpy arrays. with mmap = True (the default), the columns are memory-mapped instead of read into memory
+
+def load_table(directory, mmap = True):
+    with open(os.path.join(directory, "table.json")) as f:
+        meta = json.load(f)
+    mmap_mode = "r" if mmap else None
+    return {column: np.load(os.path.join(directory, f"{column}.npy"), mmap_mode = mmap_mode) for column in meta["columns"]}
+
+# join tables with the same columns, e.g. the tables of several stages, into one dictionary of numpy arrays
+
+def concat_tables(tables):
+    return {column: np.concatenate([table[column] for table in tables]) for column in tables[0]}
+
+# return the rows of a table matching all given column values, e.g. select(table, variable = "AMACNTCX", temp = "Cold")
+
+def select(table, **criteria):
+    mask = np.ones(len(table["value"]), dtype = bool)
+    for column, value in criteria.items():
+        mask &= table[column] == value
+    return {column: array[mask] for column, array in table.items()}
+
+# return the rows of a table grouped by the values of some columns, as a list of (tuple of column values, array of row indices) pairs sorted by the column values
+
+def group_rows(table, group_columns):
+    key = np.zeros(len(table["value"]), dtype = np.int64)
+    for column in group_columns:
+        labels, inverse = np.unique(table[column], return_inverse = True)
+        key = key * len(labels) + inverse.reshape(-1)
+    order = np.argsort(key, kind = "stable")
+    boundaries = np.flatnonzero(np.diff(key[order])) + 1
+    groups = []
+    for rows in np.split(order, boundaries) if len(order) > 0 else []:
+        groups.append((tuple(table[column][rows[0]].item() for column in group_columns), rows))
+    return groups
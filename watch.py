@@ -0,0 +1,252 @@
+import argparse
+import os
+import sys
+import time
+import getpass
+import datetime
+import html
+import prod_plot
+from itk_session import ITkSession
+from testrun_cache import TestRunCache
+from running_stats import RunningStats
+from plot_render import formats, draw_hist, render_plots
+from checkpoint import save_checkpoint, load_checkpoint
+
+# long-running mode that keeps the histograms of the selected variables up to date while Powerboards are being tested: the ITk database is polled every "interval" seconds, and only the Powerboards with new or changed test runs since the previous poll are downloaded and extracted again. the statistics of every variable are updated in place, and only the plots of the variables that changed are rendered again, together with a small dashboard (JSON and HTML) listing every variable
+
+# the ITk database cannot list the test runs changed since a given time, so every poll lists the components (one request per page) and the ids and "stateTs" of the test runs of every component (one small request per component). a Powerboard is only downloaded again if this list changed, and with a test run cache (--cache-dir), only its new or changed test runs are downloaded, so the time spent downloading, extracting and plotting grows with the new data and not with the fleet
+
+# example: python watch.py --stage Burn-In --all-variables --interval 600 --output-dir dashboard --cache-dir cache --state-file watch.json
+
+# class holding the latest value of every selected variable for every Powerboard, with its "RunningStats" in "stats". a new Powerboard is added to the statistics in place. when a value of a Powerboard already seen changes, e.g. after a retest, the variable is added to "stale", and its statistics are computed again from the values of all Powerboards by "rebuild", as a value cannot be removed from a "RunningStats". "rebuild" is called once after all changed Powerboards of a poll are added, so every variable is computed again at most once per poll however many of its Powerboards were retested. the time each variable last changed is kept in "updated", keyed by the index of the variable
+
+class Watch:
+    def __init__(self, stage, selections):
+        self.stage = stage
+        self.selections = selections
+        self.extractors = prod_plot.compile_extractors(selections)
+        self.board_values = [{} for selection in selections]
+        self.stats = [RunningStats(edges = prod_plot.hist_edges(extractor.threshold)) for extractor in self.extractors]
+        self.outofbounds_ct = [0 for selection in selections]
+        self.listings = {}
+        self.seen = {}
+        self.changed = set()
+        self.stale = set()
+        self.updated = {}
+
+    # the Powerboards whose list of test runs changed since they were last added, given the lists of test runs of a poll keyed by id code
+
+    def changed_boards(self, listings):
+        self.listings = listings
+        return [pwb_code for pwb_code, listing in listings.items() if self.seen.get(pwb_code) != listing]
+
+    # the lists of test runs of the given Powerboards in the last poll, keyed by (id code, stage) as for "prod_plot.crawl", so they are not listed again when the Powerboards are downloaded
+
+    def crawl_listings(self, pwb_codes):
+        return {(pwb_code, self.stage): self.listings[pwb_code] for pwb_code in pwb_codes if pwb_code in self.listings}
+
+    # add the test runs of one Powerboard, called by "prod_plot.crawl". the indices of the variables whose values changed are added to "changed", and those whose statistics have to be computed again to "stale"
+
+    def add_board(self, pwb_code, testRuns):
+        found = prod_plot.extract_board(testRuns, self.selections, self.extractors) if len(testRuns) > 0 else []
+        values = {i: (float(val), bool(outside)) for i, val, testRun, outside in found}
+        for i, board_values in enumerate(self.board_values):
+            old = board_values.get(pwb_code)
+            new = values.get(i)
+            if old == new:
+                continue
+            self.changed.add(i)
+            if new is None:
+                del board_values[pwb_code]
+                self.stale.add(i)
+                continue
+            board_values[pwb_code] = new
+            if old is None:
+                self.stats[i].add(new[0], passed = not new[1])
+                self.outofbounds_ct[i] += new[1]
+            else:
+                self.stale.add(i)
+        self.seen[pwb_code] = self.listings.get(pwb_code)
+
+    # compute the statistics of every stale variable again
+
+    def rebuild(self):
+        for i in sorted(self.stale):
+            self.recompute(i)
+        self.stale = set()
+
+    def recompute(self, i):
+        self.stats[i] = RunningStats(edges = prod_plot.hist_edges(self.extractors[i].threshold))
+        for val, outside in self.board_values[i].values():
+            self.stats[i].add(val, passed = not outside)
+        self.outofbounds_ct[i] = sum(outside for val, outside in self.board_values[i].values())
+
+    # the values and test run lists of every Powerboard as a dictionary that can be saved as JSON, and restored with "restore", so a restarted watch continues from its last poll
+
+    def state(self):
+        return {
+            "stage": self.stage,
+            "selections": [list(selection) for selection in self.selections],
+            "board_values": self.board_values,
+            "seen": self.seen,
+            "updated": {str(i): time for i, time in self.updated.items()}
+        }
+
+    def restore(self, state):
+        if state["stage"] != self.stage or state["selections"] != [list(selection) for selection in self.selections]:
+            raise ValueError("the saved state was made for a different stage or different variables")
+        self.board_values = [{pwb_code: tuple(value) for pwb_code, value in board_values.items()} for board_values in state["board_values"]]
+        self.seen = {pwb_code: [tuple(run) for run in listing] for pwb_code, listing in state["seen"].items()}
+        self.updated = {int(i): time for i, time in state.get("updated", {}).items()}
+        for i in range(len(self.selections)):
+            self.recompute(i)
+
+# list the components and the test runs of every component, returning the lists of (test run id, "stateTs") keyed by id code. a component whose test runs cannot be listed is left out, so it is tried again at the next poll
+
+def poll_listings(session, stage, page_size = 100, workers = 1):
+    pwb_codes = list(prod_plot.iter_components(session, page_size = page_size))
+
+    def listing(pwb_code):
+        try:
+            return [tuple(run) for run in prod_plot.list_run_ids(session, pwb_code, stage)]
+        except Exception as e:
+            print(f"{pwb_code}: test runs not listed ({type(e).__name__}: {e})")
+            return None
+
+    listings = zip(pwb_codes, prod_plot.fetch_all(listing, pwb_codes, workers))
+    return {pwb_code: runs for pwb_code, runs in listings if runs is not None}
+
+# render the plots of the given variables, returning the file name of the first format of each, keyed by the index of the variable
+
+def render_changed(watch, indices, output_dir, file_formats = ["png"], workers = 1):
+    tasks = []
+    filenames = {}
+    for i in sorted(indices):
+        val_name, state, temp, test_type = watch.selections[i]
+        if len(watch.stats[i]) == 0:
+            continue
+        threshold, threshold_dir, title, xlabel = prod_plot.variable_settings(val_name, state, temp)
+        title = f"{title}, {temp}" if temp is not None else title
+        args = (watch.stats[i], prod_plot.hist_bins, title, xlabel, threshold, watch.outofbounds_ct[i], threshold_dir, val_name)
+        for file_format in file_formats:
+            tasks.append((os.path.join(output_dir, prod_plot.plot_filename(watch.stage, val_name, state, temp, file_format)), draw_hist, args))
+        filenames[i] = prod_plot.plot_filename(watch.stage, val_name, state, temp, file_formats[0])
+    render_plots(tasks, workers)
+    return filenames
+
+# summary of every variable for the dashboard: number of values, median, standard deviation, number outside of the threshold, time of the last change, and plot file name
+
+def dashboard(watch, updated, plots):
+    variables = []
+    for i, (val_name, state, temp, test_type) in enumerate(watch.selections):
+        stats = watch.stats[i]
+        variables.append({
+            "name": " ".join(part for part in [temp, val_name, state] if part is not None),
+            "values": len(stats),
+            "median": stats.median() if len(stats) > 0 else None,
+            "sigma": stats.std() if len(stats) > 0 else None,
+            "outside": watch.outofbounds_ct[i],
+            "updated": updated.get(i),
+            "plot": plots.get(i)
+        })
+    return {"stage": watch.stage, "polled": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec = "seconds"), "boards": len(watch.seen), "variables": variables}
+
+# write the dashboard as "dashboard.json" and as "index.html", a page showing every plot with its summary that reloads itself every "refresh" seconds. both files are replaced at once, so a browser never reads a half-written page
+
+def write_dashboard(output_dir, summary, refresh):
+    save_checkpoint(os.path.join(output_dir, "dashboard.json"), summary)
+    rows = []
+    for variable in summary["variables"]:
+        if variable["values"] == 0:
+            continue
+        image = f'<img src="{html.escape(variable["plot"])}" width="480">' if variable["plot"] is not None else ""
+        rows.append(f'<div style="display:inline-block;margin:8px"><b>{html.escape(variable["name"])}</b><br>{variable["values"]} values, median {variable["median"]:.3g}, sigma {variable["sigma"]:.3g}, {variable["outside"]} outside threshold<br>updated {variable["updated"] or ""}<br>{image}</div>')
+    page = f'<!DOCTYPE html>\n<html><head><meta charset="utf-8"><meta http-equiv="refresh" content="{int(refresh)}"><title>Powerboard QC {html.escape(summary["stage"])}</title></head>\n<body><h2>Powerboard QC, {html.escape(summary["stage"])}: {summary["boards"]} Powerboards, polled {summary["polled"]}</h2>\n' + "\n".join(rows) + "\n</body></html>\n"
+    path = os.path.join(output_dir, "index.html")
+    with open(path + ".tmp", "w") as f:
+        f.write(page)
+    os.replace(path + ".tmp", path)
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = "Poll the ITk database and keep the histograms of QC test variables up to date as new Powerboards are tested.")
+    parser.add_argument("--stage", required = True, help = "testing stage: " + ", ".join(f"\"{name}\" ({code})" for name, code in prod_plot.stages.items()))
+    parser.add_argument("--temp", choices = ["Warm", "Cold"], help = "warm or cold tests, required for stages other than Thermal Cycling")
+    variable = parser.add_mutually_exclusive_group(required = True)
+    variable.add_argument("--variable", help = "test variable, as for prod_plot.py")
+    variable.add_argument("--all-variables", action = "store_true", help = "watch every variable in params")
+    parser.add_argument("--state", choices = ["OFF", "ON"], help = "OFF or ON state, required for variables with an ON/OFF state")
+    parser.add_argument("--test-type", default = None, help = "name of the test the variable is measured in (default: from params)")
+    parser.add_argument("--interval", type = float, default = 600, help = "seconds from the start of one poll to the start of the next (default: 600)")
+    parser.add_argument("--polls", type = int, default = 0, help = "number of polls before stopping, 0 to poll until interrupted (default: 0)")
+    parser.add_argument("--output-dir", default = "dashboard", help = "directory of the plots and the dashboard (default: dashboard)")
+    parser.add_argument("--format", dest = "formats", action = "append", choices = formats, help = "file format of the plots, can be given several times (default: png)")
+    parser.add_argument("--plot-workers", type = int, default = 1, help = "number of processes rendering the plots (default: 1)")
+    parser.add_argument("--state-file", default = None, help = "file the values are saved to after every poll, and restored from when starting again (default: none)")
+    parser.add_argument("--cache-dir", default = None, help = "directory of a local cache of downloaded test runs, so only new or changed test runs are downloaded (default: no cache)")
+    parser.add_argument("--page-size", type = int, default = 100)
+    parser.add_argument("--chunk-size", type = int, default = 100)
+    parser.add_argument("--workers", type = int, default = 1, help = "number of concurrent download threads (default: 1)")
+    parser.add_argument("--max-rps", type = float, default = 10.0, help = "maximum requests per second sent to the ITk database, 0 for no limit (default: 10)")
+    args = parser.parse_args(argv)
+
+    stage = prod_plot.stages.get(args.stage, args.stage)
+    if stage not in prod_plot.stages.values():
+        parser.error("please choose a valid testing stage: " + ", ".join(prod_plot.stages))
+    watch = Watch(stage, prod_plot.parse_selections(parser, args, [stage]))
+    file_formats = args.formats or ["png"]
+    os.makedirs(args.output_dir, exist_ok = True)
+
+    plots = {}
+    if args.state_file is not None:
+        state = load_checkpoint(args.state_file)
+        if state is not None:
+            try:
+                watch.restore(state)
+            except ValueError as e:
+                parser.error(f"the state file {args.state_file} cannot be used: {e}")
+            plots = render_changed(watch, range(len(watch.selections)), args.output_dir, file_formats, args.plot_workers)
+            print(f"restored {len(watch.seen)} Powerboards from {args.state_file}")
+
+    code1 = os.environ.get("ITKDB_ACCESS_CODE1") or getpass.getpass("ITk Access Code 1?\n")
+    code2 = os.environ.get("ITKDB_ACCESS_CODE2") or getpass.getpass("ITk Access Code 2?\n")
+    try:
+        session = ITkSession(code1, code2, max_rps = args.max_rps, background_refresh = True)
+    except RuntimeError:
+        print('Login unsuccessful...')
+        sys.exit(1)
+    cache = TestRunCache(args.cache_dir) if args.cache_dir is not None else None
+
+# every poll: list the test runs of every component, download and extract the Powerboards whose list changed, and render the plots of the variables that changed. a Powerboard that fails is tried again at the next poll
+
+    poll = 0
+    try:
+        while args.polls == 0 or poll < args.polls:
+            start = time.perf_counter()
+            poll += 1
+            changed = watch.changed_boards(poll_listings(session, stage, page_size = args.page_size, workers = args.workers))
+            failures = {}
+            watch.changed = set()
+            if len(changed) > 0:
+                prod_plot.crawl(session, changed, stage, watch, chunk_size = args.chunk_size, workers = args.workers, cache = cache, failures = failures, listings = watch.crawl_listings(changed))
+                watch.rebuild()
+            now = datetime.datetime.now(datetime.timezone.utc).isoformat(timespec = "seconds")
+            for i in watch.changed:
+                watch.updated[i] = now
+            plots.update(render_changed(watch, watch.changed, args.output_dir, file_formats, args.plot_workers))
+            write_dashboard(args.output_dir, dashboard(watch, watch.updated, plots), args.interval)
+            if args.state_file is not None:
+                save_checkpoint(args.state_file, watch.state())
+
+            seconds = time.perf_counter() - start
+            print(f"poll {poll} at {now}: {len(watch.listings)} Powerboards listed, {len(changed)} new or changed, {len(failures)} failed, {len(watch.changed)} variables updated in {seconds:.1f} s")
+            if args.polls == 0 or poll < args.polls:
+                time.sleep(max(0.0, args.interval - seconds))
+    except KeyboardInterrupt:
+        print("\nstopped")
+    finally:
+        session.close()
+        if cache is not None:
+            cache.close()
+
+if __name__ == "__main__":
+    main()